@@ -0,0 +1,139 @@
+"""asyncio variant of DataDownloader
+
+The index page, the archive HEAD checks and the archive downloads run on one event loop
+with at most `concurrency` archives in flight. All file work (spooling, extracting, rebuilding
+the region files) is offloaded to threads, so the loop is never blocked by the disk.
+Needs aiohttp.
+"""
+import asyncio, hashlib, os, tempfile, time
+import aiohttp
+
+from download import DataDownloader, CHUNK_SIZE
+from profiling import reset_peak_rss
+
+class AsyncDataDownloader(DataDownloader):
+    """DataDownloader whose download stage is a coroutine, see download_data_async
+
+    download_data still works outside of an event loop, so parsing and caching are unchanged.
+    """
+    def __init__(self, *args, timeout=60, **kwargs):
+        """timeout is the number of seconds to wait for a connection or for the next chunk of a response"""
+        super().__init__(*args, **kwargs)
+        self._timeout = timeout
+
+    async def _get_archive_links_async(self, session) -> dict:
+        async with session.get(self._url) as r:
+            r.raise_for_status()
+            html = await r.text()
+        return self._parse_archive_links(html)
+
+    async def _request_async(self, session, method, url, retries=3, backoff=1.0) -> (dict, int):
+        """Sends a request, retrying failed attempts with exponential backoff, returns the response headers"""
+        for attempt in range(1, retries + 1):
+            try:
+                async with session.request(method, url) as r:
+                    r.raise_for_status()
+                    return r.headers, attempt
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == retries:
+                    raise
+                await asyncio.sleep(backoff * 2**(attempt - 1))
+
+    async def _spool_archive_async(self, session, url, retries=3, backoff=1.0) -> (tempfile.TemporaryFile, str, int, int):
+        """Streams an archive into a temporary file in CHUNK_SIZE chunks, see DataDownloader._spool_archive"""
+        for attempt in range(1, retries + 1):
+            tmp = await asyncio.to_thread(tempfile.TemporaryFile, dir=self._folder)
+            try:
+                async with session.get(url) as r:
+                    r.raise_for_status()
+                    sha = hashlib.sha256()
+                    async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                        sha.update(chunk)
+                        await asyncio.to_thread(tmp.write, chunk)
+                size = tmp.tell()
+                tmp.seek(0)
+                return tmp, sha.hexdigest(), size, attempt
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                tmp.close()
+                if attempt == retries:
+                    raise
+                await asyncio.sleep(backoff * 2**(attempt - 1))
+            except BaseException:
+                #cancelled
+                tmp.close()
+                raise
+
+    async def _sync_archive_async(self, session, semaphore, href, entry, retries=3, backoff=1.0) -> (tempfile.TemporaryFile, dict, dict):
+        """Downloads a single archive unless the manifest entry shows it is unchanged, see DataDownloader._sync_archive"""
+        async with semaphore:
+            url = self._url + href
+            start = time.perf_counter()
+
+            #check the archive headers against the manifest
+            headers, attempts = await self._request_async(session, "HEAD", url, retries, backoff)
+            newEntry = self._archive_entry(url, headers)
+
+            archive = None
+            if self._is_unchanged(entry, newEntry):
+                newEntry = entry
+            else:
+                archive, newEntry["sha256"], newEntry["size"], getAttempts = await self._spool_archive_async(session, url, retries, backoff)
+                attempts += getAttempts
+                if entry and entry["sha256"] == newEntry["sha256"]:
+                    #only the headers changed
+                    newEntry["regions"] = entry["regions"]
+                    archive.close()
+                    archive = None
+
+            return archive, self._archive_report(url, entry, newEntry, archive, start, attempts), newEntry
+
+    async def download_data_async(self, concurrency=4, retries=3, backoff=1.0) -> list:
+        """Coroutine version of DataDownloader.download_data
+
+        At most `concurrency` archives are fetched at once over a connection pool of the same size.
+        Archives are extracted as soon as they arrive. If the coroutine is cancelled or an archive
+        fails, the other downloads are cancelled and the manifest and region files stay as they were.
+        """
+        #create the target directory if it doesn't exist
+        await asyncio.to_thread(os.makedirs, self._folder, exist_ok=True)
+
+        manifest = await asyncio.to_thread(self._load_manifest)
+        changedRegions = set()
+        #the peak RSS of earlier work doesn't count
+        stagePeak = reset_peak_rss()
+
+        timeout = aiohttp.ClientTimeout(total=None, connect=self._timeout, sock_read=self._timeout)
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        headers = {'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64)'}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        reports = dict()
+        with self._profiler.span("download", concurrency=concurrency) as span:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+                yearLatestMonthDict = await self._get_archive_links_async(session)
+
+                async def sync(year, href):
+                    return year, await self._sync_archive_async(session, semaphore, href, manifest.get(year), retries, backoff)
+
+                tasks = [asyncio.create_task(sync(year, href)) for year, (_, href) in yearLatestMonthDict.items()]
+                try:
+                    for task in asyncio.as_completed(tasks):
+                        year, (archive, report, entry) = await task
+                        await asyncio.to_thread(self._store_archive, year, archive, report, entry, manifest, changedRegions)
+                        reports[year] = report
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    #close the archives of downloads that finished but weren't extracted
+                    for result in await asyncio.gather(*tasks, return_exceptions=True):
+                        if isinstance(result, tuple) and result[1][0] is not None:
+                            result[1][0].close()
+            span["bytes_read"] = sum(report["bytes"] or 0 for report in reports.values())
+
+        await asyncio.to_thread(self._finish_download, manifest, changedRegions, stagePeak)
+
+        return [reports[year] for year in yearLatestMonthDict.keys()]
+
+    def download_data(self, workers=4, retries=3, backoff=1.0) -> list:
+        """Runs download_data_async with `workers` concurrent downloads on a new event loop"""
+        return asyncio.run(self.download_data_async(workers, retries, backoff))
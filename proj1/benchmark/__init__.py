@@ -0,0 +1,3 @@
+"""Benchmarks of the pipeline, run as `python -m benchmark` from proj1"""
+from benchmark.generate import generate_region, generate_dataset
+from benchmark.suite import benchmark_parse, benchmark_get_list, benchmark_iter_chunks, run_suite, environment
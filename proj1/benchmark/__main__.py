@@ -0,0 +1,23 @@
+import argparse, json
+
+from benchmark.suite import run_suite, environment
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Times the pipeline stages on synthetic region files")
+
+    argParser.add_argument("--folder", default="bench", required=False, help="where the synthetic data are generated")
+    argParser.add_argument("--scales", default="10000,100000", required=False, help="comma separated total row counts, e.g. 10000,1000000,10000000")
+    argParser.add_argument("--regions", default="PHA,STC,JHM", required=False)
+    argParser.add_argument("--engines", default="columnar", required=False, help="comma separated parse_region_data engines")
+    argParser.add_argument("--repeat", default=1, type=int, required=False)
+    argParser.add_argument("--seed", default=0, type=int, required=False)
+    argParser.add_argument("--malformed", default=0.001, type=float, required=False, help="share of malformed rows")
+    argParser.add_argument("--output", default="benchmark.json", required=False)
+
+    args = argParser.parse_args()
+
+    results = run_suite(args.folder, [int(scale) for scale in args.scales.split(",")], args.regions.split(","),
+                        args.engines.split(","), args.repeat, args.seed, args.malformed)
+
+    with open(args.output, "w") as fout:
+        json.dump({"environment":environment(), "args":vars(args), "results":results}, fout, indent=4)
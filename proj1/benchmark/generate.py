@@ -0,0 +1,130 @@
+"""Synthetic region CSV files with the schema of DataDownloader._colNames
+
+The files have the quirks of the real data: latin1 text, quoted ids, dates and times,
+decimal commas, the 25 (unknown hour) and 60 (unknown minute) time sentinels and
+a share of malformed rows (wrong field counts, empty lines, invalid cells).
+"""
+import os
+import numpy as np
+
+#rows generated and written at once
+BATCH_ROWS = 100_000
+
+#[low, high) of the integer columns, the other integer columns are in [0, 10)
+INT_RANGES = {
+    "p36":(0, 9),
+    "p37":(0, 10_000),
+    "p6":(1, 10),
+    "p7":(0, 5),
+    "p8":(0, 10),
+    "p9":(1, 3),
+    "p10":(0, 8),
+    "p11":(0, 10),
+    "p12":(100, 616),
+    "p13a":(0, 3),
+    "p13b":(0, 4),
+    "p13c":(0, 6),
+    "p14":(0, 50_000),
+    "p34":(1, 5),
+    "p47":(1970, 2021),
+    "p53":(0, 5_000),
+    "p5a":(1, 3),
+}
+
+#latin1 text of the string columns
+STREETS = np.array(["Vinohradská", "Karlovarská", "Hlavní", "Jihlavská", "Na Výsluní", "Údolní", ""])
+WORDS = np.array(["GN_V0.1UTM", "Ulice", "Silnice", "Dálnice", "Obec", ""])
+
+def _quote(values) -> np.ndarray:
+    return np.char.add(np.char.add('"', values), '"')
+
+def _integers(rng, low, high, rows) -> np.ndarray:
+    #index a table of the texts instead of converting every value
+    return np.arange(low, high).astype(str)[rng.integers(0, high - low, rows)]
+
+def _decimal_comma(values) -> np.ndarray:
+    return _quote(np.char.replace(np.char.mod("%.2f", values), ".", ","))
+
+def _column(rng, name, dtype, rows, firstId, dates) -> np.ndarray:
+    """Returns the text of one column of a batch of rows"""
+    if name == "p1":
+        return _quote(np.char.zfill((firstId + np.arange(rows)).astype(str), 12))
+    elif name == "p2a":
+        return _quote(dates.astype(str))
+    elif name == "weekday":
+        return np.arange(7).astype(str)[(dates.astype(np.int64) + 3) % 7]
+    elif name == "p2b":
+        hours = rng.integers(0, 24, rows)
+        minutes = rng.integers(0, 60, rows)
+        #unknown hours and minutes
+        hours[rng.random(rows) < 0.01] = 25
+        minutes[rng.random(rows) < 0.05] = 60
+        return _quote(np.char.add(np.char.zfill(hours.astype(str), 2), np.char.zfill(minutes.astype(str), 2)))
+    elif name in ("d", "e"):
+        #S-JTSK coordinates, sometimes missing
+        values = _decimal_comma(rng.uniform(-900_000, -400_000, rows))
+        values[rng.random(rows) < 0.02] = '""'
+        return values
+    elif name in ("f", "g"):
+        values = _decimal_comma(rng.uniform(12, 51, rows))
+        values[rng.random(rows) < 0.02] = '""'
+        return values
+    elif name in ("h", "i"):
+        return _quote(rng.choice(STREETS, rows))
+    elif np.dtype(dtype).kind == "S":
+        return _quote(rng.choice(WORDS, rows))
+    elif np.dtype(dtype).kind == "f":
+        return _integers(rng, 0, 50_000, rows)
+    return _integers(rng, *INT_RANGES.get(name, (0, 10)), rows)
+
+def _malform(rng, lines, share) -> list:
+    """Breaks `share` of the lines, the way real exports are broken"""
+    for i in np.flatnonzero(rng.random(len(lines)) < share):
+        kind = rng.integers(0, 5)
+        if kind == 0: #an extra field
+            lines[i] += ';"x"'
+        elif kind == 1: #a missing field
+            lines[i] = lines[i].rsplit(";", 1)[0]
+        elif kind == 2: #an empty line
+            lines[i] = ""
+        elif kind == 3: #a non numeric integer cell
+            fields = lines[i].split(";")
+            fields[1] = "XX"
+            lines[i] = ";".join(fields)
+        else: #a nonexistent date
+            fields = lines[i].split(";")
+            fields[3] = '"2019-02-30"'
+            lines[i] = ";".join(fields)
+    return lines
+
+def generate_region(filename, colTypes, rows, seed=0, malformed=0.001, years=(2016, 2021)):
+    """Writes a region file of `rows` rows (malformed ones included) with the schema of colTypes
+
+    colTypes are the (name, dtype) pairs of DataDownloader._colTypes. The dates are spread
+    over `years` in ascending order, like in the concatenated yearly archives.
+    """
+    rng = np.random.default_rng(seed)
+    firstDay, lastDay = np.datetime64(f"{years[0]}-01-01"), np.datetime64(f"{years[1]}-01-01")
+    days = (lastDay - firstDay).astype(np.int64)
+
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    with open(filename, "w", encoding="latin1", newline="") as fout:
+        for start in range(0, rows, BATCH_ROWS):
+            batchRows = min(BATCH_ROWS, rows - start)
+            #dates grow with the row number
+            offsets = (start + np.arange(batchRows)) * days // rows
+            dates = firstDay + np.minimum(offsets + rng.integers(0, 3, batchRows), days - 1).astype("timedelta64[D]")
+
+            columns = [_column(rng, name, dtype, batchRows, start, dates).tolist() for name, dtype in colTypes]
+            lines = _malform(rng, list(map(";".join, zip(*columns))), malformed)
+            fout.write("\r\n".join(lines) + "\r\n")
+
+def generate_dataset(folder, colTypes, regions, rows, seed=0, malformed=0.001) -> list:
+    """Writes the region files {folder}/data_{region}.csv with `rows` rows in total, returns their names"""
+    filenames = list()
+    for i, region in enumerate(regions):
+        regionRows = rows // len(regions) + (i < rows % len(regions))
+        filename = f"{folder}/data_{region}.csv"
+        generate_region(filename, colTypes, regionRows, seed + i, malformed)
+        filenames.append(filename)
+    return filenames
@@ -0,0 +1,61 @@
+"""Import time of the warm cache path, measured with python -X importtime
+
+Reading cached regions or cubes needs numpy and the proj1 modules only. requests, bs4, pandas
+and matplotlib are imported on the paths that download, build DataFrames or draw, so a warm
+invocation doesn't pay for them. Run as `python -m benchmark.imports` from proj1, it exits with 1
+when the budget is exceeded or one of the heavy modules is imported.
+"""
+import os, sys, argparse, subprocess
+
+#statement of the warm cache path
+WARM_PATH = "import download, get_stat, cube"
+
+#seconds the warm cache path may spend importing
+BUDGET = 0.3
+
+#modules the warm cache path must not import
+HEAVY_MODULES = ["requests", "bs4", "matplotlib", "pandas", "seaborn", "aiohttp"]
+
+PROJ1 = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def _import_times(statement) -> list:
+    """Returns (module, self us, cumulative us, depth) of every module the statement imports"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=PROJ1, capture_output=True, text=True, check=True)
+    times = list()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        selfTime, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), int(selfTime), int(cumulative), depth))
+    return times
+
+def import_time(statement=WARM_PATH) -> (float, dict):
+    """Returns the seconds spent importing for the statement and {module: seconds} of the
+    modules it imported directly, the modules imported at interpreter startup don't count"""
+    startup = {name for name, *_ in _import_times("pass")}
+    topLevel = {name:cumulative/1e6 for name, _, cumulative, depth in _import_times(statement) if depth == 0 and name not in startup}
+    return sum(topLevel.values()), topLevel
+
+def heavy_imports(statement=WARM_PATH) -> list:
+    """Returns the HEAVY_MODULES the statement imports"""
+    names = {name for name, *_ in _import_times(statement)}
+    return [module for module in HEAVY_MODULES if module in names]
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Checks the import time of the warm cache path")
+    argParser.add_argument("--statement", default=WARM_PATH, required=False)
+    argParser.add_argument("--budget", default=BUDGET, type=float, required=False, help="seconds")
+    argParser.add_argument("--repeat", default=5, type=int, required=False, help="the best run counts")
+
+    args = argParser.parse_args()
+
+    seconds, modules = min((import_time(args.statement) for _ in range(args.repeat)), key=lambda result : result[0])
+    for name, moduleSeconds in sorted(modules.items(), key=lambda item : -item[1])[:10]:
+        print(f"{name:>40}: {moduleSeconds*1000:.1f} ms")
+    print(f"{'total':>40}: {seconds*1000:.1f} ms (budget {args.budget*1000:.0f} ms)")
+
+    heavy = heavy_imports(args.statement)
+    if heavy:
+        print(f"Heavy modules imported: {', '.join(heavy)}")
+    sys.exit(1 if seconds > args.budget or heavy else 0)
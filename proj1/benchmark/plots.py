@@ -0,0 +1,84 @@
+"""Render time of plot_conseq and plot_damage on multi-million-row synthetic DataFrames
+
+Both plots are drawn from the small accident_stats table, so only the aggregation should
+grow with the rows. The reference stages are the previous row level paths (four groupbys,
+seaborn counting the rows of catplot(kind='count')) for comparison. Run as
+`python -m benchmark.plots` from proj1.
+"""
+import sys, argparse
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+import frame
+from regions import FILE_REGIONS
+from profiling import Profiler
+from benchmark.generate import INT_RANGES
+from benchmark.suite import _load_analysis
+
+#columns of the synthetic DataFrame
+COLUMNS = ["region", "p2a", "p12", "p13a", "p13b", "p13c", "p16", "p53"]
+
+def synthetic_frame(rows, seed=0):
+    """DataFrame of `rows` random accidents with the dtypes of get_dataframe"""
+    rng = np.random.default_rng(seed)
+    regions = np.array(sorted(FILE_REGIONS.values()), dtype="S3")
+    columns = [
+        regions[rng.integers(0, regions.shape[0], rows)],
+        np.datetime64("2016-01-01") + rng.integers(0, 5*365, rows).astype("timedelta64[D]"),
+    ]
+    for name in COLUMNS[2:]:
+        low, high = INT_RANGES.get(name, (0, 10))
+        columns.append(rng.integers(low, high, rows, dtype=np.int32))
+    return frame.to_dataframe(COLUMNS, columns)
+
+def _reference_conseq(df):
+    """The four groupbys plot_conseq used to run over the rows"""
+    dfByRegion = df.groupby(['region'], observed=True)
+    return [dfByRegion['p13a'].agg('count'), dfByRegion['p13a'].agg('sum'), dfByRegion['p13b'].agg('sum'), dfByRegion['p13c'].agg('sum')]
+
+def _reference_damage(df, sns):
+    """The catplot(kind='count') plot_damage used to draw from the rows"""
+    dmg = df[df["region"].isin(['PHA', 'HKK', 'JHM', 'PLK'])][["region", "p53", "p12"]]
+    dmg["region"] = dmg["region"].astype(str)
+    return sns.catplot(data=dmg, kind='count', x='p53', hue='p12', row='region').figure
+
+def run_plots(scales, seed=0, reference=True) -> Profiler:
+    """Times the aggregation and both plots at every scale, returns the Profiler with a span per stage"""
+    analysis = _load_analysis()
+    profiler = Profiler()
+    for rows in scales:
+        df = synthetic_frame(rows, seed)
+        with profiler.span("accident_stats", rows=rows):
+            stats = analysis.accident_stats(df)
+        for plot in (analysis.plot_conseq, analysis.plot_damage):
+            with profiler.span(f"{plot.__name__}[rows]", rows=rows):
+                fig = plot(df)
+            plt.close(fig)
+            with profiler.span(f"{plot.__name__}[stats]", rows=rows):
+                fig = plot(stats)
+            plt.close(fig)
+        if reference:
+            with profiler.span("reference_conseq_groupbys", rows=rows):
+                _reference_conseq(df)
+            with profiler.span("reference_damage_countplot", rows=rows):
+                fig = _reference_damage(df, analysis.sns)
+            plt.close(fig)
+        del df
+        print(f"{rows} rows done", file=sys.stderr)
+    return profiler
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Times plot_conseq and plot_damage on synthetic DataFrames")
+    argParser.add_argument("--scales", default="1000000,4000000", required=False, help="comma separated row counts")
+    argParser.add_argument("--seed", default=0, type=int, required=False)
+    argParser.add_argument("--no-reference", dest="reference", default=True, action="store_false", help="skip the row level reference stages")
+    argParser.add_argument("--output", default=None, required=False, help="JSON file to write the spans into")
+
+    args = argParser.parse_args()
+
+    profiler = run_plots([int(scale) for scale in args.scales.split(",")], args.seed, args.reference)
+    print(profiler.table())
+    if args.output:
+        profiler.to_json(args.output)
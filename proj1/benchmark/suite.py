@@ -0,0 +1,169 @@
+"""Timing of the pipeline stages on synthetic region files, see generate"""
+import os, sys, time, shutil, tracemalloc, platform, datetime, importlib.util
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from download import DataDownloader
+import cube
+from get_stat import plot_stat, count_accidents
+from benchmark.generate import generate_dataset
+
+#proj2/analysis.py, loaded from its path since the projects aren't packages
+ANALYSIS_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "proj2", "analysis.py")
+
+def benchmark_parse(downloader, region, engines=("genfromtxt", "columnar"), repeat=1) -> dict:
+    """Times parse_region_data with every engine, returns {engine: (rows, seconds, rows per second)}"""
+    results = dict()
+    for engine in engines:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            _, data = downloader.parse_region_data(region, engine=engine)
+            best = min(best, time.perf_counter() - start)
+        rows = data[0].shape[0]
+        results[engine] = (rows, best, rows/best)
+    return results
+
+def _concatenate_repeatedly(chunks) -> list:
+    """The previous get_list assembly, kept as the baseline"""
+    result = [np.empty(0, dtype=columnChunks[0].dtype) for columnChunks in chunks]
+    for i, columnChunks in enumerate(chunks):
+        for chunk in columnChunks:
+            result[i] = np.concatenate((result[i], chunk))
+    return result
+
+def _measure(func) -> (float, float):
+    """Returns the run time of func and the peak of memory allocated during it in MB"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak/1_048_576
+
+def benchmark_get_list(downloader, regions=None) -> dict:
+    """Times the assembly of the region columns, returns {method: (seconds, peak MB)}"""
+    #load the regions into memory first, so only the assembly is measured
+    _, chunks = downloader.get_list(regions, combine=False)
+
+    return {
+        "concatenate":_measure(lambda : _concatenate_repeatedly(chunks)),
+        "get_list":_measure(lambda : downloader.get_list(regions)),
+        "get_list(combine=False)":_measure(lambda : downloader.get_list(regions, combine=False)),
+    }
+
+def benchmark_iter_chunks(downloader, regions=None, chunk_rows=65_536) -> dict:
+    """Streams a growing number of regions with iter_chunks, returns {regions: (rows, seconds, peak MB)}
+
+    The peak is a few chunks, it should stay the same however many rows are streamed.
+    """
+    regions = regions or list(downloader._region2fileDict.keys())
+    results = dict()
+    for count in sorted({max(len(regions)//2, 1), len(regions)}):
+        rows = 0
+        def stream():
+            nonlocal rows
+            for _, chunk in downloader.iter_chunks(regions[:count], chunk_rows):
+                rows += chunk[0].shape[0]
+        seconds, peak = _measure(stream)
+        results[",".join(regions[:count])] = (rows, seconds, peak)
+    return results
+
+def _load_analysis():
+    """Returns the proj2 analysis module, raises ImportError if its dependencies are missing"""
+    spec = importlib.util.spec_from_file_location("analysis", ANALYSIS_FILENAME)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _write_dataframe(filename, names, columns):
+    """Pickles the columns as the DataFrame analysis.get_dataframe reads, with float32 coordinates and str regions like the course data"""
+    import pandas as pd
+    def converted(name, col):
+        if name in ("d", "e"):
+            return col.astype(np.float32)
+        elif name == "region":
+            return np.char.decode(np.asarray(col), "latin1")
+        return np.asarray(col)
+    df = pd.DataFrame({name:converted(name, col) for name, col in zip(names, columns)})
+    df.to_pickle(filename)
+
+def run_suite(folder, scales, regions=("PHA", "STC", "JHM"), engines=("columnar",), repeat=1, seed=0, malformed=0.001) -> list:
+    """Generates `scales` rows of synthetic data into `folder` and times every pipeline stage on them
+
+    Returns a list of {"rows", "stage", "seconds", "peak_mb"} results, the best of `repeat` runs.
+    Stages whose dependencies are missing get an "error" instead of the timings.
+    Progress is printed to stderr.
+    """
+    regions = list(regions)
+    results = list()
+
+    def record(scale, stage, func=None, error=None):
+        if error is None:
+            seconds, peak = min(_measure(func) for _ in range(repeat))
+            results.append({"rows":scale, "stage":stage, "seconds":seconds, "peak_mb":peak})
+            print(f"{scale:>10} rows {stage:>28}: {seconds:.3f} s, peak {peak:.2f} MB", file=sys.stderr)
+        else:
+            results.append({"rows":scale, "stage":stage, "error":error})
+            print(f"{scale:>10} rows {stage:>28}: {error}", file=sys.stderr)
+
+    for scale in scales:
+        scaleFolder = f"{folder}/{scale}"
+        shutil.rmtree(scaleFolder, ignore_errors=True)
+        downloader = DataDownloader(folder=scaleFolder)
+
+        record(scale, "generate", lambda : generate_dataset(scaleFolder, downloader._colTypes, regions, scale, seed, malformed))
+
+        for engine in engines:
+            record(scale, f"parse_region_data[{engine}]", lambda : [downloader.parse_region_data(region, engine=engine) for region in regions])
+
+        data = {region:downloader.parse_region_data(region) for region in regions}
+        keys = {region:downloader._source_key(region) for region in regions}
+        record(scale, "cache_write", lambda : [downloader._write_cache(region, data[region], keys[region]) for region in regions])
+        #copy the memory mapped columns, so the files are really read
+        record(scale, "cache_read", lambda : [[np.array(col) for col in downloader._read_cache(region)[1]] for region in regions])
+        del data
+
+        #a new downloader starts with nothing in memory
+        record(scale, "get_list[cold]", lambda : DataDownloader(folder=scaleFolder).get_list(regions))
+        downloader.get_list(regions)
+        record(scale, "get_list[warm]", lambda : downloader.get_list(regions))
+
+        statData = downloader.get_list(regions, columns=["region", "p2a"])
+        record(scale, "count_accidents", lambda : count_accidents(statData))
+        record(scale, "plot_stat", lambda : (plot_stat(statData), plt.close("all")))
+        del statData
+
+        record(scale, "cube_build", lambda : [downloader._write_cube(region, cube.build_cube(downloader._load_region(region, cube.COLUMNS)), keys[region]) for region in regions])
+        record(scale, "get_cube", lambda : DataDownloader(folder=scaleFolder).get_cube(regions))
+        cubeData = downloader.get_cube(regions)
+        record(scale, "plot_stat[cube]", lambda : (plot_stat(cubeData), plt.close("all")))
+
+        try:
+            analysis = _load_analysis()
+        except ImportError as e:
+            record(scale, "get_dataframe", error=str(e))
+        else:
+            pickleFilename = f"{scaleFolder}/accidents.pkl.gz"
+            _write_dataframe(pickleFilename, *downloader.get_list(regions))
+            record(scale, "get_dataframe", lambda : analysis.get_dataframe(pickleFilename))
+            #the typed DataFrame of the region columns, and read back from its file
+            frameFilename = f"{scaleFolder}/accidents.feather"
+            record(scale, "to_dataframe", lambda : downloader.get_dataframe(regions))
+            downloader.get_dataframe(regions, filename=frameFilename)
+            record(scale, "get_dataframe[frame]", lambda : analysis.get_dataframe(frameFilename))
+
+    return results
+
+def environment() -> dict:
+    """Describes the machine and the library versions the results were measured with"""
+    return {
+        "date":datetime.datetime.now().isoformat(timespec="seconds"),
+        "python":platform.python_version(),
+        "numpy":np.__version__,
+        "platform":platform.platform(),
+        "cpus":os.cpu_count(),
+    }
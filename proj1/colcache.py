@@ -0,0 +1,167 @@
+"""Columnar on-disk cache of the region data
+
+A cache is a folder with one .npy file per column and a header.json with the column names
+and the row count. The .npy files are opened with np.load(mmap_mode="r"), so loading
+a cache only maps the files and processes share the pages. The compressed variant stores the
+same arrays in a single .npz file for cold storage.
+
+The header also holds a zone map of every integer and date column: the min and max of
+every CHUNK_ROWS rows, so filtered reads can skip the chunks that can't match.
+Dictionary encoded columns are stored as their codes in {name}.npy and the dictionary in {name}.dict.npy.
+"""
+import os, json, shutil
+import numpy as np
+
+from dictcol import DictColumn
+
+#bump when the layout of the cache changes
+VERSION = 5
+
+#rows per zone map entry
+CHUNK_ROWS = 65_536
+
+def zone_map(col, chunk_rows) -> list:
+    """Returns [min, max] of every chunk of the column (None for chunks without a value),
+    or None for columns without an order (strings, objects)"""
+    kind = col.dtype.kind
+    if kind not in "iuM":
+        return None
+
+    zones = list()
+    for start in range(0, col.shape[0], chunk_rows):
+        chunk = col[start:start+chunk_rows]
+        if kind == "M":
+            chunk = chunk[~np.isnat(chunk)].astype(np.int64)
+        zones.append([int(chunk.min()), int(chunk.max())] if chunk.shape[0] else None)
+    return zones
+
+def _header(names, columns) -> dict:
+    return {
+        "version":VERSION,
+        "rows":int(columns[0].shape[0]) if columns else 0,
+        "chunk_rows":CHUNK_ROWS,
+        "columns":[_column_info(name, col, CHUNK_ROWS) for name, col in zip(names, columns)],
+    }
+
+def _column_info(name, col, chunk_rows) -> dict:
+    return {"name":name, "encoding":"dict" if isinstance(col, DictColumn) else None, "zones":zone_map(col, chunk_rows)}
+
+def _arrays(name, col) -> dict:
+    """The arrays a column is stored as, by their file names"""
+    if isinstance(col, DictColumn):
+        return {name:col.codes, f"{name}.dict":col.values}
+    return {name:col}
+
+def _save_column(path, name, col, suffix=""):
+    for arrayName, array in _arrays(name, col).items():
+        np.save(f"{path}/{arrayName}{suffix}.npy", array, allow_pickle=False)
+
+def _load_column(path, info, mmap=True):
+    codes = np.load(f"{path}/{info['name']}.npy", mmap_mode="r" if mmap else None)
+    if info["encoding"] == "dict":
+        return DictColumn(codes, np.load(f"{path}/{info['name']}.dict.npy"))
+    return codes
+
+def _read_header(path) -> dict:
+    with open(f"{path}/header.json") as fin:
+        return json.load(fin)
+
+def _write_header(path, header):
+    with open(f"{path}/header.json.tmp", "w") as fout:
+        json.dump(header, fout)
+    os.replace(f"{path}/header.json.tmp", f"{path}/header.json")
+
+def write_cache(path, names, columns):
+    """Writes the columns into the cache folder `path`, replacing any previous cache
+
+    The cache may hold only some of the columns, add_columns adds the others later.
+    """
+    header = _header(names, columns)
+
+    #write into a temporary folder first, so other processes never see a partial cache
+    tmpPath = f"{path}.tmp"
+    shutil.rmtree(tmpPath, ignore_errors=True)
+    os.makedirs(tmpPath)
+    for name, col in zip(names, columns):
+        _save_column(tmpPath, name, col)
+    _write_header(tmpPath, header)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmpPath, path)
+
+def add_columns(path, names, columns):
+    """Adds columns to an existing cache folder, they become visible once the header is replaced"""
+    header = _read_header(path)
+    present = {info["name"] for info in header["columns"]}
+    for name, col in zip(names, columns):
+        if name in present:
+            continue
+        _save_column(path, name, col, ".tmp")
+        for arrayName in _arrays(name, col):
+            os.replace(f"{path}/{arrayName}.tmp.npy", f"{path}/{arrayName}.npy")
+        header["columns"].append(_column_info(name, col, header["chunk_rows"]))
+    _write_header(path, header)
+
+def cached_columns(path) -> list:
+    """Names of the columns in a cache folder"""
+    return [info["name"] for info in _read_header(path)["columns"]]
+
+def _zone_maps(header) -> (int, int, dict):
+    return header["rows"], header["chunk_rows"], {info["name"]:info["zones"] for info in header["columns"] if info["zones"] is not None}
+
+def zone_maps(path) -> (int, int, dict):
+    """Returns the row count, the rows per chunk and {column: zone map} of a cache folder"""
+    return _zone_maps(_read_header(path))
+
+def read_cache(path, columns=None, mmap=True) -> (list, list):
+    """Reads the columns (all by default) present in a cache folder, memory mapped unless mmap=False"""
+    infos = [info for info in _read_header(path)["columns"] if columns is None or info["name"] in columns]
+    return [info["name"] for info in infos], [_load_column(path, info, mmap) for info in infos]
+
+def _open_column(path, name) -> (object, np.dtype):
+    """Opens a column file and skips its .npy header, returns the file and the dtype"""
+    fin = open(f"{path}/{name}.npy", "rb")
+    version = np.lib.format.read_magic(fin)
+    readHeader = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+    _, _, dtype = readHeader(fin)
+    return fin, dtype
+
+def iter_cache(path, columns, chunk_rows):
+    """Yields lists of the `columns` of a cache folder, chunk_rows rows at a time
+
+    The files are read instead of memory mapped, so only one chunk is in memory at a time.
+    """
+    header = _read_header(path)
+    rows = header["rows"]
+    infos = {info["name"]:info for info in header["columns"]}
+    dictionaries = [np.load(f"{path}/{name}.dict.npy") if infos[name]["encoding"] == "dict" else None for name in columns]
+    files = [_open_column(path, name) for name in columns]
+    try:
+        for start in range(0, rows, chunk_rows):
+            chunk = [np.fromfile(fin, dtype, count=min(chunk_rows, rows - start)) for fin, dtype in files]
+            yield [DictColumn(col, values) if values is not None else col for col, values in zip(chunk, dictionaries)]
+    finally:
+        for fin, _ in files:
+            fin.close()
+
+def write_compressed_cache(filename, names, columns):
+    """Writes the columns into a single compressed .npz file"""
+    header = _header(names, columns)
+    arrays = {arrayName:array for name, col in zip(names, columns) for arrayName, array in _arrays(name, col).items()}
+
+    #np.savez_compressed appends .npz to names without it
+    tmpFilename = f"{filename}.tmp.npz"
+    np.savez_compressed(tmpFilename, __header__=np.array(json.dumps(header)), **arrays)
+    os.replace(tmpFilename, filename)
+
+def compressed_zone_maps(filename) -> (int, int, dict):
+    """zone_maps of a .npz file"""
+    with np.load(filename, allow_pickle=False) as npz:
+        return _zone_maps(json.loads(str(npz["__header__"])))
+
+def read_compressed_cache(filename, columns=None) -> (list, list):
+    """Reads the columns (all by default) of a .npz file, only the requested members are decompressed"""
+    with np.load(filename, allow_pickle=False) as npz:
+        header = json.loads(str(npz["__header__"]))
+        infos = [info for info in header["columns"] if columns is None or info["name"] in columns]
+        return [info["name"] for info in infos], [DictColumn(npz[info["name"]], npz[f"{info['name']}.dict"]) if info["encoding"] == "dict" else npz[info["name"]] for info in infos]
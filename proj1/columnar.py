@@ -0,0 +1,326 @@
+"""Column-at-a-time parsing of the region CSV files
+
+The region files are split into fields in bulk and every column is converted with vectorized
+numpy operations on the raw bytes. The result is identical to
+np.genfromtxt(..., converters=CONVERTERS, invalid_raise=False): fields the vectorized path
+can't handle fall back to the per cell converters, the way np.genfromtxt converts them.
+
+Dates are datetime64[D] (NaT when unknown) and times are int16 minutes of the day. A known hour
+with the 60 (unknown minute) sentinel is stored as MINUTE_UNKNOWN - hour, the 25 (unknown hour)
+sentinel and invalid times as TIME_UNKNOWN.
+Byte string columns are dictionary encoded DictColumns.
+"""
+import re, datetime
+from itertools import repeat, compress
+import numpy as np
+
+from dictcol import DictColumn, concatenate
+
+#number of bytes of lines read from the file at once
+BATCH_SIZE = 16_777_216
+
+#minute of the day of unknown times
+TIME_UNKNOWN = -1
+#MINUTE_UNKNOWN - hour is the minute of the day of times with a known hour and an unknown minute
+MINUTE_UNKNOWN = -100
+
+def _time_code(hour, minute):
+    """Minute of the day of hour and minute, or the code of an unknown minute or time"""
+    return np.where((hour < 24) & (minute < 60), hour*60 + minute, np.where((hour < 24) & (minute == 60), MINUTE_UNKNOWN - hour, TIME_UNKNOWN))
+
+def time_converter(x):
+    m = re.search(r'(\d{2})(\d{2})', str(x)).groups()
+    return int(_time_code(int(m[0]), int(m[1])))
+
+def date_converter(x):
+    return datetime.date(*map(int, re.search(r'(\d{4})-(\d{2})-(\d{2})', str(x)).groups()))
+
+def _text(x) -> str:
+    """The cell as str, np.genfromtxt passes bytes or str depending on the numpy version"""
+    return x.decode() if isinstance(x, bytes) else x
+
+def id_converter(x):
+    return int(_text(x).strip('"'))
+
+def decimal_comma_converter(x):
+    return float(_text(x).replace(",",".").strip('"'))
+
+#per cell converters, as used by np.genfromtxt
+CONVERTERS = {
+    "p1":id_converter,
+    "p2a":date_converter,
+    "p2b":time_converter,
+    "d":decimal_comma_converter,
+    "e":decimal_comma_converter,
+    "f":decimal_comma_converter,
+    "g":decimal_comma_converter,
+}
+
+class Fields:
+    """One column of fields, given by their offsets and lengths in a shared buffer"""
+    def __init__(self, buf, starts, lengths):
+        self.buf = buf
+        self.starts = starts
+        self.lengths = lengths
+
+    def __len__(self):
+        return self.lengths.shape[0]
+
+    def strip(self, char=b'"'):
+        """Returns the fields without leading and trailing `char`"""
+        starts, lengths = self.starts.copy(), self.lengths.copy()
+        last = max(self.buf.shape[0] - 1, 0)
+        while True:
+            leading = (lengths > 0) & (self.buf[np.minimum(starts, last)] == ord(char))
+            if not leading.any():
+                break
+            starts[leading] += 1
+            lengths[leading] -= 1
+        while True:
+            trailing = (lengths > 0) & (self.buf[np.minimum(starts + lengths - 1, last)] == ord(char))
+            if not trailing.any():
+                break
+            lengths[trailing] -= 1
+        return Fields(self.buf, starts, lengths)
+
+    def chars(self) -> np.ndarray:
+        """Copies the fields into a (rows, width) uint8 matrix padded with zeros"""
+        rows = len(self)
+        width = max(int(self.lengths.max()) if rows else 0, 1)
+
+        if width <= 16:
+            #narrow fields (mostly numbers) are copied one character position at a time
+            chars = np.zeros((rows, width), dtype=np.uint8)
+            last = max(self.buf.shape[0] - 1, 0)
+            for position in range(width):
+                inField = position < self.lengths
+                chars[inField, position] = self.buf[np.minimum(self.starts[inField] + position, last)]
+            return chars
+
+        #position of every character within its field
+        total = int(self.lengths.sum())
+        inField = np.arange(total) - np.repeat(np.cumsum(self.lengths) - self.lengths, self.lengths)
+
+        chars = np.zeros(rows * width, dtype=np.uint8)
+        chars[np.repeat(np.arange(rows) * width, self.lengths) + inField] = self.buf[np.repeat(self.starts, self.lengths) + inField]
+        return chars.reshape(rows, width)
+
+    def bytes(self) -> np.ndarray:
+        """Copies the fields into a fixed width bytes array"""
+        chars = self.chars()
+        return chars.view(f"S{chars.shape[1]}").ravel()
+
+def encode_dates(col) -> np.ndarray:
+    """Converts an array of datetime.date objects (None when unknown) into datetime64[D]"""
+    return np.array(col, dtype="datetime64[D]")
+
+def _encode_time(t) -> int:
+    if t is None:
+        return TIME_UNKNOWN
+    elif isinstance(t, datetime.time): #old pickle caches
+        return t.hour*60 + t.minute
+    return t
+
+def encode_times(col) -> np.ndarray:
+    """Converts an array of time_converter codes or datetime.time objects (None when unknown) into int16 minutes of the day"""
+    return np.fromiter(map(_encode_time, col), dtype=np.int16, count=len(col))
+
+def time_unknown(times) -> np.ndarray:
+    """Mask of the times with an unknown hour"""
+    return times == TIME_UNKNOWN
+
+def minute_unknown(times) -> np.ndarray:
+    """Mask of the times with a known hour and an unknown minute"""
+    return times <= MINUTE_UNKNOWN
+
+def years(dates) -> np.ndarray:
+    """Years of datetime64 dates, -1 for NaT"""
+    return np.where(np.isnat(dates), -1, dates.astype("datetime64[Y]").astype(np.int64) + 1970)
+
+def months(dates) -> np.ndarray:
+    """Months (1-12) of datetime64 dates, -1 for NaT"""
+    return np.where(np.isnat(dates), -1, dates.astype("datetime64[M]").astype(np.int64) % 12 + 1)
+
+def weekdays(dates) -> np.ndarray:
+    """Weekdays (0 is Monday) of datetime64 dates, -1 for NaT"""
+    #1970-01-01 was a Thursday
+    return np.where(np.isnat(dates), -1, (dates.astype("datetime64[D]").astype(np.int64) + 3) % 7)
+
+def hours(times) -> np.ndarray:
+    """Hours of int16 minutes of the day, -1 for unknown hours"""
+    return np.where(minute_unknown(times), MINUTE_UNKNOWN - times, np.where(time_unknown(times), -1, times // 60))
+
+def _fallback(raw, out, mask, func, default) -> np.ndarray:
+    """Converts the cells selected by mask one by one, returns the mask of cells that failed"""
+    failed = np.zeros(len(raw), dtype=bool)
+    if not mask.any():
+        return failed
+
+    cells = raw.bytes()
+    for i in np.flatnonzero(mask):
+        try:
+            out[i] = func(cells[i])
+        except ValueError:
+            out[i] = default
+            failed[i] = True
+    return failed
+
+def _parse_integers(field) -> (np.ndarray, np.ndarray):
+    """Returns the values of fields that are plain (optionally negative) decimal integers and their mask"""
+    chars = field.chars()
+    lengths = field.lengths
+    negative = chars[:, 0] == ord("-")
+
+    values = np.zeros(len(field), dtype=np.int64)
+    valid = (lengths > negative) & (lengths - negative <= 18)
+    for position in range(chars.shape[1]):
+        digit = chars[:, position].astype(np.int64) - ord("0")
+        isDigit = (digit >= 0) & (digit <= 9)
+        inField = position < lengths
+        valid &= isDigit | ~inField | ((position == 0) & negative)
+        values = np.where(isDigit & inField, values*10 + digit, values)
+    values[negative] *= -1
+    return values, valid
+
+def _int_column(raw, field, dtype, func=int) -> np.ndarray:
+    out = np.full(len(raw), -1, dtype=dtype)
+    values, valid = _parse_integers(field)
+    out[valid] = values[valid]
+    _fallback(raw, out, ~valid & (raw.lengths > 0), func, -1)
+    return out
+
+def _float_column(raw, func=float) -> np.ndarray:
+    out = np.full(len(raw), np.nan)
+    nonEmpty = raw.lengths > 0
+    try:
+        out[nonEmpty] = raw.bytes()[nonEmpty].astype(np.float64)
+    except ValueError:
+        _fallback(raw, out, nonEmpty, func, np.nan)
+    return out
+
+def _decimal_comma_column(raw) -> (np.ndarray, np.ndarray):
+    """Returns the floats and the mask of cells that couldn't be converted"""
+    field = raw.strip()
+    chars = field.chars()
+    chars[chars == ord(",")] = ord(".")
+
+    out = np.full(len(raw), np.nan)
+    nonEmpty = field.lengths > 0
+    try:
+        out[nonEmpty] = chars.view(f"S{chars.shape[1]}").ravel()[nonEmpty].astype(np.float64)
+        failed = ~nonEmpty
+    except ValueError:
+        failed = _fallback(raw, out, nonEmpty, decimal_comma_converter, np.nan) | ~nonEmpty
+    return out, failed
+
+def _date_column(raw) -> np.ndarray:
+    field = raw.strip()
+    out = np.full(len(raw), np.datetime64("NaT"), dtype="datetime64[D]")
+
+    #YYYY-MM-DD
+    valid = field.lengths == 10
+    chars = Fields(field.buf, field.starts[valid], field.lengths[valid]).chars().reshape(-1, 10)
+    digits = chars[:, [0,1,2,3,5,6,8,9]].astype(np.int64) - ord("0")
+    isDate = ((digits >= 0) & (digits <= 9)).all(axis=1) & (chars[:, 4] == ord("-")) & (chars[:, 7] == ord("-"))
+    digits = digits[isDate]
+    year = digits[:, 0]*1000 + digits[:, 1]*100 + digits[:, 2]*10 + digits[:, 3]
+    month = digits[:, 4]*10 + digits[:, 5]
+    day = digits[:, 6]*10 + digits[:, 7]
+
+    #nonexistent dates are left to the fallback
+    yearMonth = (year - 1970).astype("datetime64[Y]") + np.clip(month - 1, 0, 11).astype("timedelta64[M]")
+    monthLength = ((yearMonth + 1).astype("datetime64[D]") - yearMonth.astype("datetime64[D]")).astype(np.int64)
+    exists = (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= monthLength)
+    days = (yearMonth.astype("datetime64[D]") + (day - 1).astype("timedelta64[D]"))[exists]
+    isDate[isDate] = exists
+    valid[valid] = isDate
+    out[valid] = days
+
+    _fallback(raw, out, ~valid, date_converter, np.datetime64("NaT"))
+    return out
+
+def _time_column(raw) -> np.ndarray:
+    field = raw.strip()
+    out = np.full(len(raw), TIME_UNKNOWN, dtype=np.int16)
+
+    #HHMM, with the 25 (unknown hour) and 60 (unknown minute) sentinels
+    hhmm, valid = _parse_integers(field)
+    valid &= (field.lengths == 4) & (hhmm >= 0)
+    out[valid] = _time_code(hhmm[valid] // 100, hhmm[valid] % 100)
+
+    _fallback(raw, out, ~valid, time_converter, TIME_UNKNOWN)
+    return out
+
+def convert_column(name, dtype, raw) -> np.ndarray:
+    """Converts a column of raw fields the same way np.genfromtxt does"""
+    if name == "p1":
+        return _int_column(raw, raw.strip(), dtype, id_converter)
+    elif name == "p2a":
+        return _date_column(raw)
+    elif name == "p2b":
+        return _time_column(raw)
+    elif name in CONVERTERS: #decimal comma
+        floats, failed = _decimal_comma_column(raw)
+        if np.dtype(dtype).kind == "f":
+            return floats
+        out = floats.astype(dtype)
+        out[failed] = b"???"
+        return DictColumn.encode(out)
+    elif np.dtype(dtype).kind == "f":
+        return _float_column(raw)
+    elif np.dtype(dtype).kind == "S":
+        cells = raw.bytes()
+        #cut longer values before they are told apart
+        return DictColumn.encode(cells.astype(dtype) if cells.itemsize > np.dtype(dtype).itemsize else cells)
+    else:
+        return _int_column(raw, raw, dtype)
+
+def split_fields(chunk, ncols) -> list:
+    """Splits a chunk of lines into columns of fields, skipping empty lines and lines with a wrong number of fields"""
+    lines = chunk.splitlines() #universal newlines, like a file opened in text mode
+
+    #comments and surrounding spaces are removed like in np.genfromtxt
+    if b"#" in chunk:
+        lines = [line.split(b"#")[0] for line in lines]
+    lines = list(filter(None, map(bytes.strip, lines, repeat(b" "))))
+
+    counts = np.fromiter(map(bytes.count, lines, repeat(b";")), dtype=np.int64, count=len(lines))
+    valid = counts == ncols - 1
+    if not valid.all():
+        lines = list(compress(lines, valid))
+
+    #every field (the last one on a line included) ends with a delimiter
+    buf = np.frombuffer(b";".join(lines) + b";", dtype=np.uint8) if lines else np.empty(0, dtype=np.uint8)
+    ends = np.flatnonzero(buf == ord(";"))
+    starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64)
+    starts, lengths = starts.reshape(-1, ncols), (ends - starts).reshape(-1, ncols)
+    return [Fields(buf, starts[:, i], lengths[:, i]) for i in range(ncols)]
+
+def iter_batches(fin, batch_size=BATCH_SIZE):
+    """Yields chunks of whole lines of a binary file"""
+    while True:
+        batch = fin.readlines(batch_size)
+        if not batch:
+            return
+        yield b"".join(batch)
+
+def iter_columns(fin, colTypes, selected=None, batch_size=BATCH_SIZE):
+    """Yields lists of column arrays of a binary file object, one per batch of lines
+
+    Only the columns with indices in `selected` (all by default) are converted, in that order.
+    """
+    selected = range(len(colTypes)) if selected is None else selected
+    for chunk in iter_batches(fin, batch_size):
+        fields = split_fields(chunk, len(colTypes))
+        yield [convert_column(*colTypes[i], fields[i]) for i in selected]
+
+def parse_columns(fin, colTypes, selected=None, batch_size=BATCH_SIZE) -> list:
+    """Parses a binary file object into a list of column arrays
+
+    Only the columns with indices in `selected` (all by default) are converted, in that order.
+    """
+    selected = range(len(colTypes)) if selected is None else selected
+    batches = list(iter_columns(fin, colTypes, selected, batch_size))
+    if not batches:
+        return [DictColumn.empty() if np.dtype(colTypes[i][1]).kind == "S" else np.empty(0, dtype=colTypes[i][1]) for i in selected]
+    return [concatenate(columnBatches) for columnBatches in zip(*batches)]
@@ -0,0 +1,130 @@
+"""Pre-aggregated accident counts of a region
+
+A cube holds, for every combination of its dimensions that occurs in the region data,
+the number of accidents and the sums of the MEASURES columns. It is a dict {name: array}
+of equally long arrays, one per dimension and one per measure. The 7 causes, 10 road surfaces
+and 6 damage bins make at most 420 rows per month, 5,040 per region and year, however many
+accidents there are. That is still a sizeable share of a small region (the 33,313 accidents
+of five years of PHA make 8,111 rows), the cube pays off on the large data. DataDownloader
+writes one next to every region cache, aggregate() groups it further for the plots.
+"""
+import os
+import numpy as np
+
+import columnar
+
+#bump when the dimensions or the measures change
+VERSION = 1
+
+#columns of the region data a cube is built from
+COLUMNS = ["region", "p2a", "p12", "p16", "p53", "p13a", "p13b", "p13c", "p14"]
+
+DIMENSIONS = ["region", "year", "month", "cause", "surface", "damage"]
+MEASURES = ["count", "p13a", "p13b", "p13c", "p14", "p53"]
+
+#accident cause groups of p12, [100, 200) is 0, ... [600, 700) is 5, the rest -1
+CAUSE_BINS = [100, 200, 300, 400, 500, 600, 700]
+#vehicle damage (p53) bins [0, 50], (50, 200], (200, 500], (500, 1000], (1000, inf), the rest -1
+DAMAGE_BINS = [0, 50, 200, 500, 1000, np.inf]
+
+def cause_groups(p12) -> np.ndarray:
+    """Cause group (see CAUSE_BINS) of every p12 value"""
+    groups = np.searchsorted(CAUSE_BINS, p12, side="right") - 1
+    return np.where(groups < len(CAUSE_BINS) - 1, groups, -1)
+
+def damage_bins(p53) -> np.ndarray:
+    """Damage bin (see DAMAGE_BINS) of every p53 value"""
+    bins = np.searchsorted(DAMAGE_BINS, p53, side="left") - 1
+    #the lowest bound belongs to the first bin
+    return np.where(np.asarray(p53) == DAMAGE_BINS[0], 0, bins)
+
+def _group(keys) -> (np.ndarray, np.ndarray):
+    """Returns the index of the first row of every distinct combination of the key columns and
+    the group of every row, the groups are sorted by the keys"""
+    codes, sizes = list(), list()
+    for key in keys:
+        values, inverse = np.unique(key, return_inverse=True)
+        codes.append(inverse.reshape(-1))
+        sizes.append(max(values.shape[0], 1))
+    combined = np.ravel_multi_index(codes, sizes) if codes else np.zeros(0, dtype=np.int64)
+    _, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+    return first, inverse.reshape(-1)
+
+def _sums(inverse, groups, cube_or_data, measures) -> dict:
+    sums = dict()
+    for name in measures:
+        if name == "count" and name not in cube_or_data:
+            sums[name] = np.bincount(inverse, minlength=groups).astype(np.int64)
+            continue
+        col = np.asarray(cube_or_data[name])
+        #missing values don't count, like in pandas sums
+        weights = np.nan_to_num(col) if col.dtype.kind == "f" else col
+        total = np.bincount(inverse, weights=weights, minlength=groups)
+        sums[name] = total if col.dtype.kind == "f" else total.astype(np.int64)
+    return sums
+
+def build_cube(data) -> dict:
+    """Aggregates the region data {column: array} with the COLUMNS into a cube"""
+    dates = data["p2a"]
+    dimensions = {
+        "region":np.asarray(data["region"]),
+        "year":columnar.years(dates).astype(np.int16),
+        "month":columnar.months(dates).astype(np.int8),
+        "cause":cause_groups(data["p12"]).astype(np.int8),
+        "surface":np.asarray(data["p16"]).astype(np.int16),
+        "damage":damage_bins(data["p53"]).astype(np.int8),
+    }
+    first, inverse = _group(dimensions.values())
+    cube = {name:dimension[first] for name, dimension in dimensions.items()}
+    cube.update(_sums(inverse, first.shape[0], data, MEASURES))
+    return cube
+
+def empty() -> dict:
+    return build_cube({name:np.empty(0, dtype=dtype) for name, dtype in zip(COLUMNS, ["S3", "datetime64[D]"] + [np.int32]*6 + [float])})
+
+def concatenate(cubes) -> dict:
+    """Joins the cubes of several regions"""
+    cubes = list(cubes)
+    if not cubes:
+        return empty()
+    return {name:np.concatenate([cube[name] for cube in cubes]) for name in cubes[0]}
+
+def aggregate(cube, by, measures=None, where=None) -> dict:
+    """Sums the measures (all by default) of the cube rows over the `by` dimensions
+
+    `where` keeps only the rows with one of the listed values, like {"region":["PHA", "JHM"], "year":[2020]}.
+    Returns a cube with the `by` dimensions, sorted by them.
+    """
+    measures = measures or MEASURES
+    if where:
+        mask = np.ones(cube["count"].shape[0], dtype=bool)
+        for name, values in where.items():
+            mask &= np.isin(cube[name], np.asarray(values, dtype=cube[name].dtype))
+        cube = {name:col[mask] for name, col in cube.items()}
+
+    first, inverse = _group([cube[name] for name in by])
+    result = {name:cube[name][first] for name in by}
+    result.update(_sums(inverse, first.shape[0], cube, measures))
+    return result
+
+def pivot(cube, rows, columns, measure="count") -> (np.ndarray, np.ndarray, np.ndarray):
+    """Returns the values of the `rows` and `columns` dimensions and the dense matrix of the measure"""
+    table = aggregate(cube, [rows, columns], [measure])
+    rowValues, rowCodes = np.unique(table[rows], return_inverse=True)
+    colValues, colCodes = np.unique(table[columns], return_inverse=True)
+    matrix = np.zeros((rowValues.shape[0], colValues.shape[0]), dtype=table[measure].dtype)
+    matrix[rowCodes.reshape(-1), colCodes.reshape(-1)] = table[measure]
+    return rowValues, colValues, matrix
+
+def write_cube(filename, cube):
+    """Writes the cube into a .npz file through a temporary file"""
+    tmpFilename = f"{filename}.tmp.npz"
+    np.savez(tmpFilename, __version__=np.array(VERSION), **cube)
+    os.replace(tmpFilename, filename)
+
+def read_cube(filename) -> dict:
+    """Reads a cube written by write_cube, None if it was written by another VERSION"""
+    with np.load(filename, allow_pickle=False) as npz:
+        if int(npz["__version__"]) != VERSION:
+            return None
+        return {name:npz[name] for name in DIMENSIONS + MEASURES}
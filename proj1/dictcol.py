@@ -0,0 +1,133 @@
+"""Dictionary encoded byte string columns
+
+The S100 columns hold few distinct, short values, so they are kept as an array of integer
+codes into a shared dictionary of the distinct values instead of 100 bytes per cell.
+A DictColumn can be indexed, sliced and compared like the array it encodes, decode()
+(or np.asarray) returns the byte strings.
+"""
+import numpy as np
+
+def _code_dtype(count) -> np.dtype:
+    """The smallest unsigned integer type with `count` codes"""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if count <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+def _trim(values) -> np.ndarray:
+    """Narrows byte strings to the width of the longest one"""
+    width = int(np.char.str_len(values).max()) if values.shape[0] else 0
+    return values.astype(f"S{max(width, 1)}")
+
+def _unique_by_hash(col) -> (np.ndarray, np.ndarray):
+    """np.unique(col, return_inverse=True) of a byte string array that sorts integer hashes instead of strings
+
+    Returns (None, None) if two distinct values have the same hash.
+    """
+    chars = col.view(np.uint8).reshape(col.shape[0], col.dtype.itemsize)
+    hashes = np.zeros(col.shape[0], dtype=np.uint64)
+    for position in range(chars.shape[1]):
+        hashes = hashes * np.uint64(1_099_511_628_211) + chars[:, position]
+    _, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+
+    values = col[first]
+    if not (values[inverse] == col).all():
+        return None, None
+
+    #the dictionary is sorted, like the values of np.unique
+    order = np.argsort(values)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.shape[0])
+    return values[order], rank[inverse]
+
+class DictColumn:
+    """A column of byte strings stored as integer codes into a dictionary of the distinct values"""
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+
+    @classmethod
+    def encode(cls, col) -> "DictColumn":
+        col = np.ascontiguousarray(col)
+        values, codes = _unique_by_hash(col)
+        if values is None:
+            values, codes = np.unique(col, return_inverse=True)
+        return cls(codes.astype(_code_dtype(values.shape[0])).reshape(-1), _trim(values))
+
+    @classmethod
+    def empty(cls) -> "DictColumn":
+        return cls(np.empty(0, dtype=np.uint8), np.empty(0, dtype="S1"))
+
+    def decode(self) -> np.ndarray:
+        """Returns the byte strings, as wide as the longest value"""
+        return self.values[self.codes]
+
+    @property
+    def shape(self) -> tuple:
+        return self.codes.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.values.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.values.nbytes
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def __getitem__(self, key):
+        codes = self.codes[key]
+        if np.ndim(codes) == 0:
+            return self.values[codes]
+        return DictColumn(codes, self.values)
+
+    def __array__(self, dtype=None, copy=None):
+        decoded = self.decode()
+        return decoded if dtype is None else decoded.astype(dtype)
+
+    def copy(self) -> "DictColumn":
+        return DictColumn(np.array(self.codes), self.values)
+
+    def isin(self, values) -> np.ndarray:
+        """Mask of the rows with one of the values, compares the codes instead of the strings"""
+        return np.isin(self.codes, np.flatnonzero(np.isin(self.values, np.asarray(values, dtype=bytes))))
+
+    def __eq__(self, other):
+        if isinstance(other, (bytes, str)):
+            return self.isin([other])
+        return self.decode() == np.asarray(other)
+
+    def __ne__(self, other):
+        return ~(self == other)
+
+    def __repr__(self):
+        return f"DictColumn({self.shape[0]} rows, {self.values.shape[0]} values)"
+
+def concatenate(columns):
+    """np.concatenate that also merges the dictionaries of DictColumns"""
+    if not any(isinstance(col, DictColumn) for col in columns):
+        return np.concatenate(columns)
+    columns = [col if isinstance(col, DictColumn) else DictColumn.encode(col) for col in columns]
+
+    values = np.unique(np.concatenate([col.values for col in columns]))
+    codeDtype = _code_dtype(values.shape[0])
+    #translate the codes of every column into the merged dictionary
+    codes = [np.searchsorted(values, col.values).astype(codeDtype)[col.codes] for col in columns]
+    return DictColumn(np.concatenate(codes) if codes else np.empty(0, dtype=codeDtype), values)
+
+def nbytes(col) -> int:
+    """Bytes of a column held in memory, memory mapped arrays (or codes) don't count"""
+    if isinstance(col, DictColumn):
+        return col.values.nbytes + (0 if isinstance(col.codes, np.memmap) else col.codes.nbytes)
+    return 0 if isinstance(col, np.memmap) else col.nbytes
+
+def savings(names, columns, dtype="S100") -> dict:
+    """Returns {column: {"plain", "encoded", "saved"}} bytes of the DictColumns against the fixed width dtype"""
+    report = dict()
+    for name, col in zip(names, columns):
+        if isinstance(col, DictColumn):
+            plain = col.shape[0] * np.dtype(dtype).itemsize
+            report[name] = {"plain":plain, "encoded":col.nbytes, "saved":plain - col.nbytes}
+    return report
@@ -1,19 +1,92 @@
-import os, re, io, requests, datetime
-import gzip, pickle, csv, zipfile
-from bs4 import BeautifulSoup
+import os, re, time
+import zipfile, json, hashlib
+import tempfile
+from itertools import repeat, chain
+from collections import OrderedDict
 import numpy as np
-import matplotlib.pyplot as plt
 
+from columnar import CONVERTERS, BATCH_SIZE, parse_columns, iter_columns, encode_dates, encode_times
+import colcache, predicate, dictcol, cube
+from profiling import Profiler, peak_rss, reset_peak_rss
+from regions import FILE_REGIONS
+
+
+#size of the chunks used when streaming archives and region files
+CHUNK_SIZE = 1_048_576
+
+#bump when the output of parse_region_data changes, so old caches are rebuilt
+SCHEMA_VERSION = 4
+
+class RegionMemoryCache:
+    """LRU cache of loaded region data limited by the size of the arrays it holds
+
+    Memory mapped columns don't count towards the budget, their pages belong to the page cache.
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() #region -> (data, source stat, size)
+
+    @staticmethod
+    def _size(data) -> int:
+        return sum(map(dictcol.nbytes, data.values()))
+
+    def get(self, region, stat=None):
+        """Returns the region data, None if it isn't cached or was loaded from a different source file"""
+        entry = self._entries.get(region)
+        if entry is None or entry[1] != stat:
+            self.invalidate(region)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(region)
+        self.hits += 1
+        return entry[0]
+
+    def contains(self, region, stat=None) -> bool:
+        """Like get, but doesn't count as a hit or miss"""
+        return region in self._entries and self._entries[region][1] == stat
+
+    def put(self, region, data, stat=None):
+        self.invalidate(region)
+        size = self._size(data)
+        self._entries[region] = (data, stat, size)
+        self.bytes += size
+
+        #evict the least recently used regions, but always keep the one just added
+        while self.max_bytes is not None and self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, _, evictedSize) = self._entries.popitem(last=False)
+            self.bytes -= evictedSize
+            self.evictions += 1
+
+    def invalidate(self, region):
+        entry = self._entries.pop(region, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def stats(self) -> dict:
+        return {"hits":self.hits, "misses":self.misses, "evictions":self.evictions, "bytes":self.bytes, "regions":list(self._entries.keys())}
 
 class UnexpectedDataFormatException(Exception):
     def __init__(self, msg):
-        super.__init__(f"Unexpected data format: {msg}")
+        super().__init__(f"Unexpected data format: {msg}")
 
 class DataDownloader:
-    def __init__(self, url="https://ehw.fit.vutbr.cz/izv/", folder="data", cache_filename="data_{}.pkl.gz"):
+    def __init__(self, url="https://ehw.fit.vutbr.cz/izv/", folder="data", cache_filename="data_{}.pkl.gz", manifest_filename="manifest.json", cache_format="npy", memory_budget=None, profiler=None):
+        """
+        cache_format is one of "npy" (memory mapped column files in {folder}/cache),
+        "npz" (compressed, for cold storage) and "pkl.gz" (the old cache_filename pickles).
+        memory_budget limits the bytes of region data kept in memory (None for no limit).
+        profiler records the stages (see profiling), nothing is recorded without one.
+        """
         self._url = url
         self._folder = folder
         self._cache_filename = cache_filename
+        self._manifest_filename = manifest_filename
+        self._cache_format = cache_format
+        self._profiler = profiler or Profiler(enabled=False)
 
         #Dictionary for translating czech month names to their respective numbers
         self._monthDict = {
@@ -32,27 +105,11 @@ class DataDownloader:
         }
 
         #Dictionary for translating file names to their region acronyms
-        self._file2regionDict = {
-            "00.csv":"PHA",
-            "01.csv":"STC",
-            "02.csv":"JHC",
-            "03.csv":"PLK",
-            "04.csv":"ULK",
-            "05.csv":"HKK",
-            "06.csv":"JHM",
-            "07.csv":"MSK",
-            "14.csv":"OLK",
-            "15.csv":"ZLK",
-            "16.csv":"VYS",
-            "17.csv":"PAK",
-            "18.csv":"LBK",
-            "19.csv":"KVK"
-        }
-
+        self._file2regionDict = FILE_REGIONS
         self._region2fileDict = {v:k for (k,v) in self._file2regionDict.items()}
 
         #region data cache
-        self._regionCache = {k:None for k in self._region2fileDict.keys()}
+        self._regionCache = RegionMemoryCache(memory_budget)
 
         self._colNames = [
             "p1",
@@ -120,11 +177,11 @@ class DataDownloader:
             "p5a"
         ]
 
+        #the byte string ('S100') columns are returned dictionary encoded, see dictcol
         self._nonIntCols = {
             "p1":np.int64,
-            # "p2a":np.datetime64,
-            "p2a":datetime.date,
-            "p2b":datetime.time,
+            "p2a":"datetime64[D]",
+            "p2b":np.int16, #minutes of the day, see columnar.time_unknown and minute_unknown
             "p14":float,
             "a":'S100', #semantics unknown
             "b":'S100', #semantics unknown
@@ -145,64 +202,260 @@ class DataDownloader:
 
         self._colTypes = list(zip(self._colNames, [self._nonIntCols[col] if col in self._nonIntCols.keys() else np.int32 for col in self._colNames]))
 
+        #the per cell converters return date and time objects, they are encoded afterwards
+        self._objectEncoders = {"p2a":encode_dates, "p2b":encode_times}
+
+
+    def _get_archive_links(self, s) -> dict:
+        """Returns {year: (month, href)} of the latest archive in each year listed on the index page"""
+        #get html from url
+        r = s.get(self._url)
+        r.raise_for_status()
+        return self._parse_archive_links(r.text)
+
+    def _parse_archive_links(self, html) -> dict:
+        """Returns {year: (month, href)} of the latest archive in each year listed in the index page html"""
+        #parse html
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
+        if not soup:
+            raise UnexpectedDataFormatException("Wrong html format, Beautiful Soup failed.")
+
+        links = soup.find_all("a", string="ZIP") #find all links with zip text
+
+        #find latest month in each year(redundant data in earlier months)
+        yearLatestMonthDict = dict() #contains the latest month (and the href of it's zip) in a given year for which we have any data
+        for link in links:
+            #get a month+year
+            monthYearString = link.parent.previous_sibling.string
+            m = re.match(r'(\w+) (\d+)', monthYearString)
+            if m:
+                month = self._monthDict[m.group(1).lower()]
+                year = m.group(2)
+            else:
+                raise UnexpectedDataFormatException("Wrong month year format")
+
+            #check if this is a newer month
+            if year in yearLatestMonthDict.keys():
+                if int(month) > int(yearLatestMonthDict[year][0]):
+                    yearLatestMonthDict[year] = (month, link.get('href'))
+            else:
+                yearLatestMonthDict[year] = (month, link.get('href'))
+
+        return yearLatestMonthDict
+
+    def _request(self, s, method, url, retries=3, backoff=1.0) -> ("requests.Response", int):
+        """Sends a request, retrying failed attempts with exponential backoff"""
+        import requests
+        for attempt in range(1, retries + 1):
+            try:
+                r = s.request(method, url)
+                r.raise_for_status()
+                return r, attempt
+            except requests.RequestException:
+                if attempt == retries:
+                    raise
+                time.sleep(backoff * 2**(attempt - 1))
+
+    def _spool_archive(self, s, url, retries=3, backoff=1.0) -> (tempfile.TemporaryFile, str, int, int):
+        """Streams an archive into a temporary file in CHUNK_SIZE chunks
+
+        Returns the rewound temporary file, sha256 of the content, its size and the number of attempts.
+        """
+        import requests
+        for attempt in range(1, retries + 1):
+            tmp = tempfile.TemporaryFile(dir=self._folder)
+            try:
+                with s.get(url, stream=True) as r:
+                    r.raise_for_status()
+                    sha = hashlib.sha256()
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        sha.update(chunk)
+                        tmp.write(chunk)
+                size = tmp.tell()
+                tmp.seek(0)
+                return tmp, sha.hexdigest(), size, attempt
+            except requests.RequestException:
+                tmp.close()
+                if attempt == retries:
+                    raise
+                time.sleep(backoff * 2**(attempt - 1))
+
+    def _sync_archive(self, s, href, entry, retries=3, backoff=1.0) -> (tempfile.TemporaryFile, dict, dict):
+        """Downloads a single archive unless the manifest entry shows it is unchanged
+
+        Returns a temporary file with the archive (None if it was skipped), a report and the new manifest entry.
+        """
+        url = self._url + href
+        start = time.perf_counter()
+
+        #check the archive headers against the manifest
+        r, attempts = self._request(s, "HEAD", url, retries, backoff)
+        newEntry = self._archive_entry(url, r.headers)
+
+        archive = None
+        if self._is_unchanged(entry, newEntry):
+            newEntry = entry
+        else:
+            archive, newEntry["sha256"], newEntry["size"], getAttempts = self._spool_archive(s, url, retries, backoff)
+            attempts += getAttempts
+            if entry and entry["sha256"] == newEntry["sha256"]:
+                #only the headers changed
+                newEntry["regions"] = entry["regions"]
+                archive.close()
+                archive = None
+
+        return archive, self._archive_report(url, entry, newEntry, archive, start, attempts), newEntry
+
+    @staticmethod
+    def _archive_entry(url, headers) -> dict:
+        """Returns the manifest entry of an archive from its response headers"""
+        return {
+            "url":url,
+            "size":int(headers["Content-Length"]) if "Content-Length" in headers else None,
+            "etag":headers.get("ETag"),
+            "last_modified":headers.get("Last-Modified"),
+            "sha256":None,
+            "regions":[],
+        }
 
-    def download_data(self):
-        datePattern = re.compile(r'(\w+)\ (\d{4})') #pattern for parsing date
+    @staticmethod
+    def _is_unchanged(entry, newEntry) -> bool:
+        """Checks whether the headers of an archive match its manifest entry"""
+        return bool(entry and entry["url"] == newEntry["url"] and entry["size"] == newEntry["size"] \
+                and (entry["etag"], entry["last_modified"]) == (newEntry["etag"], newEntry["last_modified"]) \
+                and (newEntry["etag"] or newEntry["last_modified"]))
+
+    @staticmethod
+    def _archive_report(url, entry, newEntry, archive, start, attempts) -> dict:
+        return {
+            "url":url,
+            "bytes":newEntry["size"] if newEntry is not entry else 0,
+            "seconds":time.perf_counter() - start,
+            "attempts":attempts,
+            "skipped":archive is None,
+        }
+
+    def _load_manifest(self) -> dict:
+        manifestFilename = f"{self._folder}/{self._manifest_filename}"
+        if not os.path.isfile(manifestFilename):
+            return {}
+        with open(manifestFilename) as fin:
+            return json.load(fin)
+
+    def _atomic_write(self, filename, chunks):
+        """Writes the chunks into a temporary file and moves it over `filename`"""
+        tmpFilename = f"{filename}.tmp"
+        with open(tmpFilename, "wb") as fout:
+            for chunk in chunks:
+                fout.write(chunk)
+        os.replace(tmpFilename, filename)
+
+    def _rebuild_region_file(self, region, manifest):
+        """Concatenates the extracted parts of all archives in year order into the region file"""
+        def parts():
+            for year in sorted(manifest.keys()):
+                partFilename = f"{self._folder}/parts/{year}/data_{region}.csv"
+                if region in manifest[year]["regions"] and os.path.isfile(partFilename):
+                    with open(partFilename, "rb") as fin:
+                        yield from iter(lambda : fin.read(CHUNK_SIZE), b"")
+
+        self._atomic_write(f"{self._folder}/data_{region}.csv", parts())
+        #data in memory are no longer valid
+        self._regionCache.invalidate(region)
+
+    def download_data(self, workers=4, retries=3, backoff=1.0) -> list:
+        """Synchronizes the region files with the latest archive of every year
+
+        Archives whose headers match the manifest are skipped, the rest are fetched concurrently
+        by `workers` threads sharing one connection pool, each request is retried up to `retries` times.
+        Only the region files fed by a changed archive are rebuilt. Archives are streamed through temporary
+        files, so the memory use doesn't depend on archive size. Returns a list of per archive reports,
+        each with the peak RSS (in MB) since the download started, or of the whole process where the
+        peak can't be reset (see profiling.reset_peak_rss).
+        """
+        #requests is only imported when something is downloaded
+        import requests, requests.adapters
+        from concurrent.futures import ThreadPoolExecutor
 
         #create the target directory if it doesn't exist
         if not os.path.isdir(self._folder):
             os.mkdir(self._folder)
 
-        with requests.Session() as s:
+        manifest = self._load_manifest()
+        changedRegions = set()
+        #the peak RSS of earlier work doesn't count
+        stagePeak = reset_peak_rss()
+
+        reports = list()
+        with self._profiler.span("download", workers=workers) as span, requests.Session() as s:
             #set headers
             s.headers.update({'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64)'})
-            #get html from url
-            r = s.get(self._url)
-            r.raise_for_status()
-
-            #parse html
-            soup = BeautifulSoup(r.text, 'html.parser')
-            if soup:
-                links = soup.find_all("a", string="ZIP") #find all links with zip text
-
-                #find latest month in each year(redundant data in earlier months)
-                yearLatestMonthDict = dict() #contains the latest month (and the soup object of it's zip href) in a given year for which we have any data
-                for link in links:
-                    #get a month+year
-                    monthYearString = link.parent.previous_sibling.string
-                    m = re.match(r'(\w+) (\d+)', monthYearString)
-                    if m:
-                        month = self._monthDict[m.group(1).lower()]
-                        year = m.group(2)
-                    else:
-                        raise UnexpectedDataFormatException("Wrong month year format")
-
-                    #check if this is a newer month
-                    if year in yearLatestMonthDict.keys():
-                        if int(month) > int(yearLatestMonthDict[year][0]):
-                            yearLatestMonthDict[year] = (month, link)
-                    else:
-                        yearLatestMonthDict[year] = (month, link)
-
-                for year, (month, link) in yearLatestMonthDict.items():
-                    #download data
-                    href = link.get('href')
-                    r = s.get(self._url+link.get('href'))#get archive
-                    r.raise_for_status()
-
-                    #open archive
-                    with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
-                        for filename in zf.namelist():
-                            if filename in self._file2regionDict.keys(): #check if file we are interested in
-                                with zf.open(filename) as f: #open file
-                                    #construct new filename
-                                    newFileName = f"data/data_{self._file2regionDict[filename]}.csv"
-                                    #save the file
-                                    open(newFileName, "ab").write(f.read())
-            else:
-                raise UnexpectedDataFormatException("Wrong html format, Beautiful Soup failed.")
-
-    def parse_region_data(self, region:str) -> (list, list):
+            #share one connection pool between all workers
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+
+            yearLatestMonthDict = self._get_archive_links(s)
+            years = list(yearLatestMonthDict.keys())
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                archives = executor.map(lambda year : self._sync_archive(s, yearLatestMonthDict[year][1], manifest.get(year), retries, backoff), years)
+
+                for year, (archive, report, entry) in zip(years, archives):
+                    self._store_archive(year, archive, report, entry, manifest, changedRegions)
+                    reports.append(report)
+            span["bytes_read"] = sum(report["bytes"] or 0 for report in reports)
+
+        self._finish_download(manifest, changedRegions, stagePeak)
+
+        return reports
+
+    def _store_archive(self, year, archive, report, entry, manifest, changedRegions):
+        """Extracts the region files of a synchronized archive and records it in the manifest"""
+        if report["skipped"]:
+            print(f"Skipped {report['url']} (unchanged)")
+        else:
+            print(f"Downloaded {report['url']} ({report['bytes']/1_048_576:.2f} MB) in {report['seconds']:.2f} s, attempts: {report['attempts']}")
+
+        if archive is not None:
+            #extract the region files of this archive
+            partFolder = f"{self._folder}/parts/{year}"
+            os.makedirs(partFolder, exist_ok=True)
+            with archive, zipfile.ZipFile(archive) as zf:
+                for filename in zf.namelist():
+                    if filename in self._file2regionDict.keys(): #check if file we are interested in
+                        region = self._file2regionDict[filename]
+                        with zf.open(filename) as f: #open file
+                            self._atomic_write(f"{partFolder}/data_{region}.csv", iter(lambda : f.read(CHUNK_SIZE), b""))
+                        if region not in entry["regions"]:
+                            entry["regions"].append(region)
+
+            #regions this archive fed before or feeds now
+            changedRegions.update(entry["regions"])
+            changedRegions.update(manifest[year]["regions"] if year in manifest else [])
+
+        manifest[year] = entry
+        report["peak_rss"] = peak_rss()
+
+    def _finish_download(self, manifest, changedRegions, stagePeak):
+        """Rebuilds the changed region files and writes the manifest, stagePeak tells whether the peak RSS was reset when the download started"""
+        with self._profiler.span("rebuild_regions", regions=len(changedRegions)):
+            for region in sorted(changedRegions):
+                self._rebuild_region_file(region, manifest)
+
+        self._atomic_write(f"{self._folder}/{self._manifest_filename}", [json.dumps(manifest, indent=4).encode()])
+
+        peak = peak_rss()
+        if peak is not None:
+            print(f"Peak RSS of the {'download stage' if stagePeak else 'process'}: {peak:.2f} MB")
+
+    def parse_region_data(self, region:str, engine="columnar", columns=None) -> (list, list):
+        """Parses the region file into a list of column names and a list of column arrays
+
+        The default "columnar" engine converts whole columns at once and only the requested
+        `columns` (all by default), "genfromtxt" is the original (slower) per cell parser with identical output.
+        """
         filename = f"{self._folder}/data_{region}.csv"
         if not os.path.isfile(filename):
             self.download_data()
@@ -231,55 +484,450 @@ class DataDownloader:
             "light",
         ]
 
-        def timeConverter(x):
-            m = re.search(r'(\d{2})(\d{2})', str(x)).groups()
-            return datetime.time(int(m[0]) if m[0] != "25" else -1, int(m[1]) if m[1] != "60" else -1)
-
-        converters = {
-            "p1":lambda x : int(x.decode().strip('"')),
-            "p2a":lambda x : datetime.date(*map(int, re.search(r'(\d{4})-(\d{2})-(\d{2})', str(x)).groups())),
-            #"p2a":lambda x: np.datetime64(x.decode().strip('"')),
-            "p2b":timeConverter,
-            "d":lambda x : float(x.decode().replace(",",".").strip('"')),
-            "e":lambda x : float(x.decode().replace(",",".").strip('"')),
-            "f":lambda x : float(x.decode().replace(",",".").strip('"')),
-            "g":lambda x : float(x.decode().replace(",",".").strip('"')),
-        }
+        names = columns or ["region"]+self._colNames
+        #the region column doesn't come from the file, but the row count does
+        parsedNames = [name for name in names if name != "region"] or self._colNames[:1]
 
-        with open(filename, encoding="latin1") as fin:
-            arr = np.genfromtxt(fin, names=self._colNames, dtype=self._colTypes, delimiter=";", converters=converters, invalid_raise=False)
-
-        shape = arr.shape
-
-        return (["region"]+self._colNames, [np.full(shape[0], region, dtype="S3")]+[arr[name] for name in self._colNames])
+        with self._profiler.span("parse", region=region, engine=engine) as span:
+            if engine == "genfromtxt":
+                with open(filename, encoding="latin1") as fin:
+                    colTypes = [(name, object if name in self._objectEncoders else colType) for name, colType in self._colTypes]
+                    arr = np.genfromtxt(fin, names=self._colNames, dtype=colTypes, delimiter=";", converters=CONVERTERS, invalid_raise=False)
+                parsed = [self._encode_column(name, arr[name]) for name in parsedNames]
+            else:
+                with open(filename, "rb") as fin:
+                    parsed = parse_columns(fin, self._colTypes, [self._colNames.index(name) for name in parsedNames])
+
+            parsed = dict(zip(parsedNames, parsed))
+            rows = parsed[parsedNames[0]].shape[0]
+            span.update(rows=rows, bytes_read=os.path.getsize(filename))
+        return (names, [parsed[name] if name != "region" else np.full(rows, region, dtype="S3") for name in names])
+
+    def _encode_column(self, name, col) -> np.ndarray:
+        """Converts a column of date or time objects into its native dtype and dictionary encodes byte strings,
+        like the columnar engine returns them"""
+        if col.dtype == object and name in self._objectEncoders:
+            return self._objectEncoders[name](col)
+        elif isinstance(col, np.ndarray) and col.dtype.kind == "S" and name != "region":
+            return dictcol.DictColumn.encode(col)
+        return col
+
+    def _cache_path(self, region, cache_format=None) -> str:
+        cache_format = cache_format or self._cache_format
+        if cache_format == "pkl.gz":
+            return self._cache_filename.format(region)
+        elif cache_format == "npz":
+            return f"{self._folder}/cache/data_{region}.npz"
+        return f"{self._folder}/cache/data_{region}"
+
+    def _has_cache(self, region, cache_format=None) -> bool:
+        cache_format = cache_format or self._cache_format
+        path = self._cache_path(region, cache_format)
+        return os.path.isfile(f"{path}/header.json" if cache_format == "npy" else path)
+
+    def _source_stat(self, region) -> dict:
+        """Size and modification time of the region file, None if it doesn't exist"""
+        filename = f"{self._folder}/data_{region}.csv"
+        if not os.path.isfile(filename):
+            return None
+        stat = os.stat(filename)
+        return {"size":stat.st_size, "mtime_ns":stat.st_mtime_ns}
+
+    def _source_key(self, region) -> dict:
+        """Identifies the region file and the schema a cache was built from"""
+        key = {"schema":SCHEMA_VERSION, "format":colcache.VERSION}
+        stat = self._source_stat(region)
+        if stat is not None:
+            sha = hashlib.sha256()
+            with open(f"{self._folder}/data_{region}.csv", "rb") as fin:
+                for chunk in iter(lambda : fin.read(CHUNK_SIZE), b""):
+                    sha.update(chunk)
+            key.update(stat, sha256=sha.hexdigest())
+        return key
+
+    def _is_cache_valid(self, region, cache_format=None) -> bool:
+        """Checks that the cache was built from the current region file with the current schema"""
+        return self._is_key_valid(region, f"{self._cache_path(region, cache_format)}.json")
+
+    def _is_key_valid(self, region, keyFilename) -> bool:
+        """Checks the source key in keyFilename against the current region file and schema"""
+        if not os.path.isfile(keyFilename):
+            return False
+        with open(keyFilename) as fin:
+            key = json.load(fin)
+
+        stat = self._source_stat(region)
+        if (key["schema"], key["format"]) != (SCHEMA_VERSION, colcache.VERSION):
+            return False
+        elif stat is None: #nothing to compare with
+            return True
+        elif key.get("size") != stat["size"]:
+            return False
+        elif key.get("mtime_ns") == stat["mtime_ns"]:
+            return True
+
+        #the file was touched, compare the content
+        newKey = self._source_key(region)
+        if newKey.get("sha256") != key.get("sha256"):
+            return False
+        self._atomic_write(keyFilename, [json.dumps(newKey).encode()])
+        return True
+
+    def _write_cache(self, region, data, key, add=False):
+        """Writes the region data and its source key into the region cache
+
+        Both go through temporary files, so other processes never see a partial cache.
+        With add=True the columns are added to the existing "npy" cache.
+        """
+        cachePath = self._cache_path(region)
+        with self._profiler.span("cache_write", region=region, format=self._cache_format) as span:
+            span.update(rows=data[1][0].shape[0] if data[1] else 0, bytes_written=sum(col.nbytes for col in data[1]))
+            if self._cache_format == "npy":
+                os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+                if add:
+                    colcache.add_columns(cachePath, *data)
+                    return
+                colcache.write_cache(cachePath, *data)
+            elif self._cache_format == "npz":
+                os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+                colcache.write_compressed_cache(cachePath, *data)
+            else:
+                import gzip, pickle
+                with gzip.open(f"{cachePath}.tmp", "w") as fout:
+                    pickle.dump(data, fout)
+                os.replace(f"{cachePath}.tmp", cachePath)
+
+            self._atomic_write(f"{cachePath}.json", [json.dumps(key).encode()])
+
+    def _read_cache(self, region, columns=None, cache_format=None) -> (list, list):
+        """Reads the columns (all by default) present in the region cache"""
+        cache_format = cache_format or self._cache_format
+        cachePath = self._cache_path(region, cache_format)
+        with self._profiler.span("cache_read", region=region, format=cache_format) as span:
+            if cache_format == "npy":
+                names, data = colcache.read_cache(cachePath, columns)
+            elif cache_format == "npz":
+                names, data = colcache.read_compressed_cache(cachePath, columns)
+            else:
+                import gzip, pickle
+                with gzip.open(cachePath) as fin:
+                    names, data = pickle.load(fin)
+                #old pickles hold date and time objects and plain byte strings
+                names, data = tuple(map(list, zip(*[(name, self._encode_column(name, col)) for name, col in zip(names, data) if columns is None or name in columns]))) or ([], [])
+            #memory mapped columns are only read when they are used
+            span.update(rows=data[0].shape[0] if data else 0, bytes_read=sum(col.nbytes for col in data))
+        return names, data
+
+    def _cached_columns(self, region) -> list:
+        """Names of the columns in the valid region cache"""
+        if not self._has_valid_cache(region):
+            return []
+        elif self._cache_format == "npy":
+            return colcache.cached_columns(self._cache_path(region))
+        return ["region"] + self._colNames
+
+    def _build_cache(self, region, columns=None) -> (list, list):
+        """Parses the columns (all by default) of the region file and writes them into the region cache
+
+        Only the "npy" format can hold some of the columns, the other formats are always built whole.
+        """
+        #the key is taken first, a region file changed during parsing makes the cache stale
+        key = self._source_key(region)
+        add = self._cache_format == "npy" and self._has_valid_cache(region)
+        print(f"Parsing region {region}")
+        data = self.parse_region_data(region, columns=columns if self._cache_format == "npy" else None)
+        self._write_cache(region, data, key, add)
+        #the cube is built along with the cache when its columns were parsed
+        if set(cube.COLUMNS) <= set(data[0]):
+            self._build_cube(region, dict(zip(*data)), key)
+        return data
+
+    def _cube_path(self, region) -> str:
+        return f"{self._folder}/cache/cube_{region}.npz"
+
+    def _write_cube(self, region, regionCube, key):
+        """Writes the region cube and its source key next to the region cache"""
+        cubePath = self._cube_path(region)
+        os.makedirs(os.path.dirname(cubePath), exist_ok=True)
+        cube.write_cube(cubePath, regionCube)
+        self._atomic_write(f"{cubePath}.json", [json.dumps(key).encode()])
+
+    def _build_cube(self, region, data, key) -> dict:
+        """Aggregates the region data {column: array} into the region cube and writes it"""
+        with self._profiler.span("cube_build", region=region) as span:
+            regionCube = cube.build_cube(data)
+            self._write_cube(region, regionCube, key)
+            span.update(rows=data["p2a"].shape[0], bytes_written=sum(col.nbytes for col in regionCube.values()))
+        return regionCube
+
+    def _load_cube(self, region) -> dict:
+        """Returns the cube of the region, it is built from the region data if it is missing or stale"""
+        cubePath = self._cube_path(region)
+        if os.path.isfile(cubePath) and self._is_key_valid(region, f"{cubePath}.json"):
+            regionCube = cube.read_cube(cubePath)
+            if regionCube is not None:
+                return regionCube
+
+        key = self._source_key(region)
+        return self._build_cube(region, self._load_region(region, cube.COLUMNS), key)
+
+    def source_digest(self, region) -> str:
+        """sha256 of the region file, taken from the key of a valid cube or cache instead of hashing the file if possible"""
+        for keyFilename in (f"{self._cube_path(region)}.json", f"{self._cache_path(region)}.json"):
+            if self._is_key_valid(region, keyFilename):
+                with open(keyFilename) as fin:
+                    sha = json.load(fin).get("sha256")
+                if sha is not None:
+                    return sha
+        return self._source_key(region).get("sha256")
+
+    def get_cube(self, regions=None) -> dict:
+        """Returns the cube (see cube) of the regions, without reading their row data once the cubes are built"""
+        regions = regions or list(self._region2fileDict.keys())
+        with self._profiler.span("get_cube", regions=len(regions)) as span:
+            regionsCube = cube.concatenate(self._load_cube(region) for region in regions)
+            span["rows"] = regionsCube["count"].shape[0]
+        return regionsCube
+
+    def _has_legacy_cache(self, region) -> bool:
+        """Checks for a data_{}.pkl.gz cache written before caches had keys, that is newer than the region file"""
+        cacheFilename = self._cache_path(region, "pkl.gz")
+        if not self._has_cache(region, "pkl.gz") or os.path.isfile(f"{cacheFilename}.json"):
+            return False
+        stat = self._source_stat(region)
+        return stat is None or stat["mtime_ns"] <= os.stat(cacheFilename).st_mtime_ns
+
+    def _has_valid_cache(self, region) -> bool:
+        return self._has_cache(region) and self._is_cache_valid(region)
+
+    def _load_region(self, region, columns=None) -> dict:
+        """Returns the columns (all by default) of the region from memory, from the cache or from the region file"""
+        names = columns or ["region"]+self._colNames
+
+        #get from memory
+        data = self._regionCache.get(region, self._source_stat(region))
+        data = dict(data) if data is not None else dict()
+        missing = [name for name in names if name not in data]
+
+        if missing and self._has_valid_cache(region): #load from cache
+            data.update(zip(*self._read_cache(region, missing)))
+        elif missing and self._cache_format != "pkl.gz" and self._has_legacy_cache(region): #convert the old cache
+            legacy = self._read_cache(region, cache_format="pkl.gz")
+            self._write_cache(region, legacy, self._source_key(region))
+            data.update(zip(*legacy))
+
+        missing = [name for name in names if name not in data]
+        if missing: #read from data file
+            data.update(zip(*self._build_cache(region, missing)))
+
+        #the region file may have been downloaded just now
+        self._regionCache.put(region, data, self._source_stat(region))
+        return {name:data[name] for name in names}
+
+    def _zone_maps(self, region) -> (int, int, dict):
+        """Returns the row count, the rows per chunk and the zone maps of the valid region cache, None without one"""
+        if self._cache_format == "pkl.gz" or not self._has_valid_cache(region):
+            return None
+        elif self._cache_format == "npy":
+            return colcache.zone_maps(self._cache_path(region))
+        return colcache.compressed_zone_maps(self._cache_path(region))
+
+    def _filter_region(self, region, data, where) -> dict:
+        """Returns the rows of the region data matching the normalized filter
+
+        Only the chunks whose zone maps may match are copied out of the (memory mapped) columns.
+        """
+        rows = next(iter(data.values())).shape[0]
+        zoneMaps = self._zone_maps(region)
+        if zoneMaps is not None and zoneMaps[0] == rows:
+            _, chunkRows, zones = zoneMaps
+            keep = predicate.chunk_mask(zones, where, -(-rows // chunkRows))
+            slices = [slice(start, start+chunkRows) for start in np.flatnonzero(keep) * chunkRows]
+            if len(slices) < keep.shape[0]:
+                data = {name:dictcol.concatenate([col[s] for s in slices]) if slices else col[:0] for name, col in data.items()}
+
+        mask = predicate.row_mask(data, where)
+        return {name:col[mask] for name, col in data.items()}
+
+    def dictionary_report(self, regions=None) -> dict:
+        """Returns {column: {"plain", "encoded", "saved"}} bytes of the dictionary encoded columns of the regions
+        against storing them as fixed width byte strings"""
+        names = [name for name, colType in self._colTypes if np.dtype(colType).kind == "S"]
+        return dictcol.savings(*self.get_list(regions, columns=names), dtype="S100")
+
+    def cache_stats(self) -> dict:
+        """Returns the hit, miss and eviction counters of the in memory region cache"""
+        return self._regionCache.stats()
+
+    def convert_pickle_caches(self, regions=None):
+        """Converts the existing data_{}.pkl.gz caches of the regions into the current cache format"""
+        for region in regions or list(self._region2fileDict.keys()):
+            if self._has_cache(region, "pkl.gz"):
+                self._write_cache(region, self._read_cache(region, cache_format="pkl.gz"), self._source_key(region))
+
+    def _build_caches(self, regions, workers, columns=None):
+        """Builds the missing region caches (or their missing columns) in parallel on `workers` processes"""
+        names = columns or ["region"]+self._colNames
+        missing = [region for region in regions if not self._regionCache.contains(region, self._source_stat(region))
+                   and not set(names) <= set(self._cached_columns(region))]
+        if not missing:
+            return
+
+        #download once here, not in every worker
+        if any(not os.path.isfile(f"{self._folder}/data_{region}.csv") for region in missing):
+            self.download_data()
 
-    def get_list(self, regions=None):
+        from concurrent.futures import ProcessPoolExecutor
+        #the workers only write the cache files, the data is loaded from them afterwards
+        #instead of being pickled back to this process
+        with self._profiler.span("build_caches", regions=len(missing), workers=workers), ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_build_region_cache, repeat(self.worker_args()), missing, repeat(columns)))
+
+    def worker_args(self) -> tuple:
+        """Arguments of a DataDownloader with the same files in another process"""
+        return (self._url, self._folder, self._cache_filename, self._manifest_filename, self._cache_format)
+
+    def get_list(self, regions=None, workers=1, combine=True, columns=None, where=None):
+        """Returns the column names and the columns of the regions
+
+        Only the requested `columns` (all by default) are parsed or read from the cache.
+        `where` keeps only the rows matching a filter like {"p2a":("2021-01-01", None), "p36":[1, 2]}
+        (see predicate), the cache chunks that can't match are skipped.
+        With workers > 1 the regions that aren't cached yet are parsed in parallel on a process pool.
+        With combine=False every column is a list of per region arrays instead of one concatenated array.
+        """
         #if regions==None, we consider all regions
         regions = regions or list(self._region2fileDict.keys())
+        names = columns or ["region"] + self._colNames
+        colTypes = dict(self._colTypes, region="S3")
+        where = predicate.normalize_where(where, colTypes)
+        #the filtered columns are loaded too
+        loadNames = names + [name for name in where if name not in names]
+
+        if workers > 1:
+            self._build_caches(regions, workers, loadNames)
+
+        #get region data
+        with self._profiler.span("load_regions", regions=len(regions)) as span:
+            regionData = [self._load_region(region, loadNames) for region in regions]
+            span["rows"] = sum(next(iter(data.values())).shape[0] for data in regionData)
+        if where:
+            with self._profiler.span("filter", regions=len(regions)) as span:
+                regionData = [self._filter_region(region, data, where) for region, data in zip(regions, regionData)]
+                span["rows"] = sum(next(iter(data.values())).shape[0] for data in regionData)
+        chunks = [[data[name] for data in regionData] for name in names]
+
+        if not combine:
+            return names, chunks
+
+        #allocate every column once and copy the regions into it
+        rowCounts = [columnChunk.shape[0] for columnChunk in chunks[0]]
+        offsets = np.concatenate(([0], np.cumsum(rowCounts, dtype=np.int64)))
+        result = list()
+        with self._profiler.span("concatenate", columns=len(names)) as span:
+            for name, columnChunks in zip(names, chunks):
+                if any(isinstance(chunk, dictcol.DictColumn) for chunk in columnChunks):
+                    #the dictionaries of the regions are merged
+                    result.append(dictcol.concatenate(columnChunks))
+                    continue
+                col = np.empty(offsets[-1], dtype=colTypes[name])
+                for start, end, chunk in zip(offsets[:-1], offsets[1:], columnChunks):
+                    col[start:end] = chunk
+                result.append(col)
+            span.update(rows=int(offsets[-1]), bytes_written=sum(col.nbytes for col in result))
+
+        return names, result
+
+    def get_dataframe(self, regions=None, columns=None, where=None, filename=None):
+        """Returns the columns of the regions as a pandas DataFrame with the dtypes of proj2 get_dataframe (see frame)
+
+        With a .parquet or .feather filename the DataFrame is written into it, and later read
+        back from it as long as it was built from the same region files with the same arguments.
+        """
+        import frame
+        regions = regions or list(self._region2fileDict.keys())
+        key = None
+        if filename:
+            key = json.loads(json.dumps({"regions":{region:self.source_digest(region) for region in regions}, "columns":columns, "where":where}, default=str))
+            if frame.frame_key(filename) == key:
+                with self._profiler.span("frame_read") as span:
+                    df = frame.read_frame(filename)
+                    span.update(rows=len(df), bytes_read=os.path.getsize(filename))
+                return df
+
+        names, data = self.get_list(regions, columns=columns, where=where)
+        with self._profiler.span("to_dataframe", columns=len(names)) as span:
+            df = frame.to_dataframe(names, data)
+            span["rows"] = len(df)
+        if filename:
+            with self._profiler.span("frame_write") as span:
+                frame.write_frame(filename, df, key)
+                span.update(rows=len(df), bytes_written=os.path.getsize(filename))
+        return df
+
+    def _iter_region(self, region, names, chunk_rows):
+        """Yields lists of the region columns in batches of at most chunk_rows rows
+
+        The columns come from memory, from the "npy" cache or are parsed from the region file,
+        so nothing but the current batch is kept in memory.
+        """
+        stat = self._source_stat(region)
+        data = self._regionCache.get(region, stat) if self._regionCache.contains(region, stat) else None
+        if data is not None and all(name in data for name in names):
+            yield [data[name] for name in names]
+            return
+
+        if self._cache_format == "npy" and set(names) <= set(self._cached_columns(region)):
+            yield from colcache.iter_cache(self._cache_path(region), names, chunk_rows)
+            return
 
-        result = [np.empty(0, dtype="S3")] + [np.empty(0, dtype=colType[1]) for colType in self._colTypes] #don't forget region collumn
-
-        for region in regions:
-            cacheFilename = self._cache_filename.format(region)
-
-            #get region data
-            if self._regionCache[region]: #get from memory
-                data = self._regionCache[region]
-            elif os.path.isfile(cacheFilename): #load from cache file
-                with gzip.open(cacheFilename) as fin:
-                    self._regionCache[region] = pickle.load(fin)
-                    data = self._regionCache[region]
-            else: #read from data file
-                with gzip.open(cacheFilename, "w") as fout:
-                    print(f"Parsing region {region}")
-                    self._regionCache[region] = self.parse_region_data(region)
-                    pickle.dump(self._regionCache[region], fout)
-                    data = self._regionCache[region]
-
-            for i, col in enumerate(data[1]):
-                result[i] = np.concatenate((result[i], col))
-
-        return ["region"] + self._colNames, result
+        filename = f"{self._folder}/data_{region}.csv"
+        if not os.path.isfile(filename):
+            self.download_data()
+        parsedNames = [name for name in names if name != "region"] or self._colNames[:1]
+        with open(filename, "rb") as fin:
+            for batch in iter_columns(fin, self._colTypes, [self._colNames.index(name) for name in parsedNames], min(BATCH_SIZE, chunk_rows*512)):
+                parsed = dict(zip(parsedNames, batch))
+                rows = batch[0].shape[0]
+                yield [parsed[name] if name != "region" else np.full(rows, region, dtype="S3") for name in names]
+
+    def iter_chunks(self, regions=None, chunk_rows=65_536, columns=None):
+        """Yields (names, columns) of the regions chunk_rows rows at a time, the last chunk may be shorter
+
+        Unlike get_list, the regions are streamed from the cache or the region files,
+        so the memory used doesn't depend on the number of rows.
+        """
+        regions = regions or list(self._region2fileDict.keys())
+        names = columns or ["region"] + self._colNames
+
+        batches = chain.from_iterable(self._iter_region(region, names, chunk_rows) for region in regions)
+        for chunk in _rebatch(batches, chunk_rows):
+            yield names, chunk
+
+def _rebatch(batches, chunk_rows):
+    """Regroups batches of columns of any size into batches of chunk_rows rows"""
+    pending, pendingRows = list(), 0
+    for batch in batches:
+        rows = batch[0].shape[0]
+        start = 0
+        while start < rows:
+            take = min(chunk_rows - pendingRows, rows - start)
+            pending.append([col[start:start+take] for col in batch])
+            pendingRows += take
+            start += take
+            if pendingRows == chunk_rows:
+                yield [cols[0] if len(cols) == 1 else dictcol.concatenate(cols) for cols in zip(*pending)]
+                pending, pendingRows = list(), 0
+
+        #copy the rest of the batch, so the whole batch isn't kept alive while the next one is read
+        pending = [[col.copy() for col in cols] for cols in pending]
+        del batch
+    if pendingRows:
+        yield [cols[0] if len(cols) == 1 else dictcol.concatenate(cols) for cols in zip(*pending)]
+
+def _build_region_cache(downloaderArgs, region, columns=None):
+    """Process pool worker of DataDownloader._build_caches"""
+    DataDownloader(*downloaderArgs)._build_cache(region, columns)
 
 def main():
     downloader = DataDownloader()
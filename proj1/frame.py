@@ -0,0 +1,389 @@
+"""pandas DataFrames of the region data with the dtypes of proj2 get_dataframe
+
+PLAN declares the dtype of every accident column: a category with fixed levels (or the
+levels found in the data), the smallest integer type, interval bins, or the column as it is.
+to_dataframe() applies it to the columns of DataDownloader.get_list, apply_plan() to a
+DataFrame like the accidents pickle, both in one pass that builds the DataFrame once.
+The fixed levels keep concatenated regions and months categorical instead of object.
+
+write_frame() and read_frame() keep the DataFrame in a .parquet or .feather file with these
+dtypes, so loading it again skips the conversion altogether.
+"""
+import os, json, hashlib
+import numpy as np
+import pandas as pd
+
+import dictcol, cube
+from regions import FILE_REGIONS
+
+#bump when PLAN changes, so persisted frames are built again
+VERSION = 3
+
+#labels of the cause groups of p12 (see cube.CAUSE_BINS)
+CAUSE_LABELS = [
+    "nezaviněná řidičem",
+    "nepřiměřená rychlost jízdy",
+    "nesprávné předjíždění",
+    "nedání přednosti v jízdě",
+    "nesprávný způsob jízdy",
+    "technická závada vozidla"
+]
+
+#the intervals pd.cut(p53, cube.DAMAGE_BINS, include_lowest=True) labels the damage bins with
+DAMAGE_LABELS = pd.IntervalIndex.from_breaks([cube.DAMAGE_BINS[0] - 0.001] + cube.DAMAGE_BINS[1:], closed="right")
+
+#dtype of the accident columns:
+#   ("category", levels)                        categories, levels None for the sorted values in the data,
+#                                               the values that aren't a level are added after them
+#   ("int", None)                               the smallest integer type holding the values
+#   ("bins", (binning, labels, ordered))        categories of the bin binning() puts every value in, -1 for none
+#   ("date", column)                            datetime column added from another one
+#   None                                        left as it is
+#the columns missing here are categories of the values in the data, the float ones are left as they are
+PLAN = {
+    "p1":("int", None), #id
+    "region":("category", sorted(FILE_REGIONS.values())),
+    "weekday":("category", range(7)),
+    "p12":("bins", (cube.cause_groups, CAUSE_LABELS, False)), #accident cause
+    "p13a":("int", None), #deaths
+    "p13b":("int", None), #heavy injuries
+    "p13c":("int", None), #light injuries
+    "p14":None, #total material damage
+    "p16":("category", range(10)), #road surface
+    "p53":("bins", (cube.damage_bins, DAMAGE_LABELS, True)), #vehicle damage
+    "p5a":("category", [1, 2]), #inside or outside of a town
+    "date":("date", "p2a"),
+}
+
+#fingerprint of the last argument of apply_plan and the DataFrame it returned, only one is
+#kept since a converted DataFrame of all regions takes hundreds of MB
+_applied = (None, None)
+
+FORMATS = (".parquet", ".feather")
+
+#key of the schema metadata write_frame stores the categories in
+METADATA_KEY = b"accidents"
+
+def column_plan(name, dtype):
+    """The PLAN entry of a column"""
+    if name in PLAN:
+        return PLAN[name]
+    return None if getattr(dtype, "kind", "O") == "f" else ("category", None)
+
+def _signed_codes(codes, count) -> np.ndarray:
+    """The codes as the signed integer type pandas expects, viewed without a copy when they fit"""
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        if count <= np.iinfo(dtype).max:
+            break
+    if codes.dtype.itemsize == np.dtype(dtype).itemsize and codes.dtype.kind == "u":
+        return codes.view(dtype)
+    return codes.astype(dtype, copy=False)
+
+def _categorical(codes, categories, ordered=False) -> pd.Categorical:
+    return pd.Categorical.from_codes(_signed_codes(np.asarray(codes), len(categories)), categories, ordered=ordered, validate=False)
+
+def _smallest_int(values) -> np.ndarray:
+    """The integer values as the smallest type holding them, without a copy if that is their type"""
+    if values.dtype.kind not in "iu" or values.shape[0] == 0:
+        return values
+    low, high = values.min(), values.max()
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return values.astype(dtype, copy=False)
+    return values
+
+def _factorize(col) -> (np.ndarray, np.ndarray):
+    """Returns the sorted distinct values and the code of every value of an integer or date column, -1 for NaT"""
+    values = col.view(np.int64) if col.dtype.kind == "M" else col
+    known = ~np.isnat(col) if col.dtype.kind == "M" else np.ones(col.shape[0], dtype=bool)
+    present = values[known]
+    codes = np.full(col.shape[0], -1, dtype=np.int64)
+    if present.shape[0] == 0:
+        return col[:0], codes
+
+    low, high = int(present.min()), int(present.max())
+    if high - low < 1 << 20:
+        #small ranges are mapped through a lookup table instead of sorting
+        seen = np.bincount(present - low, minlength=high - low + 1) > 0
+        categories = (np.flatnonzero(seen) + low).astype(values.dtype)
+        codes[known] = (np.cumsum(seen) - 1)[present - low]
+    else:
+        categories, codes[known] = np.unique(present, return_inverse=True)
+    return categories.view(col.dtype), codes
+
+def _decoded(categories, codes) -> (np.ndarray, np.ndarray):
+    """The categories with the byte strings decoded like DictColumns (latin1) and the codes into them"""
+    if categories.dtype != object or not any(isinstance(value, bytes) for value in categories):
+        return categories, codes
+    decoded = [value.decode("latin1") if isinstance(value, bytes) else value for value in categories]
+    #a value may be there both as bytes and as str
+    decodedCodes, uniques = pd.factorize(np.array(decoded, dtype=object), sort=True)
+    return np.asarray(uniques), np.append(decodedCodes, -1)[codes]
+
+def _category_codes(col) -> (np.ndarray, np.ndarray):
+    """Returns the sorted distinct values of a column and the code of every value, -1 for missing values"""
+    if isinstance(col, dictcol.DictColumn):
+        return np.char.decode(col.values, "latin1"), col.codes
+    elif isinstance(col, pd.Series):
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            return _decoded(col.cat.categories.to_numpy(), col.cat.codes.to_numpy())
+        elif col.dtype.kind in "iuM":
+            return _factorize(col.to_numpy())
+        codes, categories = pd.factorize(col, sort=True)
+        return _decoded(np.asarray(categories), codes)
+    elif col.dtype.kind == "S":
+        return _category_codes(dictcol.DictColumn.encode(col))
+    return _factorize(col)
+
+def _recode(categories, codes, levels) -> (np.ndarray, np.ndarray):
+    """The codes into the fixed levels instead of the categories
+
+    The values that aren't a level, like the -1 defaults of the parser, are added after the levels.
+    """
+    levels = np.asarray(list(levels))
+    if categories.dtype.kind in "iu":
+        levels = levels.astype(categories.dtype)
+    positions = pd.Index(levels).get_indexer(categories)
+    if (positions < 0).any():
+        levels = np.concatenate([levels.astype(object) if categories.dtype == object else levels, categories[positions < 0]])
+        positions = pd.Index(levels).get_indexer(categories)
+    #code -1 takes the -1 appended at the end
+    return levels, np.append(positions, -1)[codes]
+
+def _convert(name, col, plan):
+    """The column converted by its PLAN entry, col is an array, a DictColumn or a Series"""
+    if plan is None:
+        return col
+    kind, arg = plan
+    if kind == "category":
+        if isinstance(col, pd.Series) and isinstance(col.dtype, pd.CategoricalDtype) and (arg is None or list(col.cat.categories) == list(arg)):
+            return col
+        categories, codes = _category_codes(col)
+        if arg is not None:
+            categories, codes = _recode(categories, codes, arg)
+        return _categorical(codes, categories)
+    elif isinstance(col, pd.Series) and isinstance(col.dtype, pd.CategoricalDtype):
+        #binned already
+        return col
+
+    values = col.to_numpy() if isinstance(col, pd.Series) else np.asarray(col)
+    if kind == "int":
+        return _smallest_int(values)
+    elif kind == "bins":
+        binning, labels, ordered = arg
+        return _categorical(binning(values), labels, ordered)
+    elif kind == "date":
+        return values.astype("datetime64[s]", copy=False) if values.dtype.kind == "M" else pd.to_datetime(values).to_numpy()
+    raise ValueError(f"Unknown plan {kind} of column {name}")
+
+def _plan_columns(names, columns, dtypes) -> dict:
+    """Converts the columns by PLAN and adds the derived ones, like the date column"""
+    data = {name:_convert(name, col, column_plan(name, dtype)) for name, col, dtype in zip(names, columns, dtypes)}
+    for name, plan in PLAN.items():
+        if plan is not None and plan[0] == "date" and name not in data and plan[1] in names:
+            data[name] = _convert(name, columns[names.index(plan[1])], plan)
+    return data
+
+def to_dataframe(names, columns) -> pd.DataFrame:
+    """DataFrame of the (names, columns) of DataDownloader.get_list with the dtypes of PLAN
+
+    The integer and float columns are wrapped without a copy when their dtype stays,
+    the dictionary encoded ones become categoricals over their codes.
+    """
+    dtypes = [col.dtype if not isinstance(col, dictcol.DictColumn) else np.dtype(object) for col in columns]
+    return pd.DataFrame(_plan_columns(list(names), columns, dtypes), copy=False)
+
+def fingerprint(df) -> str:
+    """sha256 of the column names, dtypes, values and index of the DataFrame"""
+    sha = hashlib.sha256()
+    if isinstance(df.index, pd.RangeIndex):
+        sha.update(repr(df.index).encode())
+    else:
+        sha.update(pd.util.hash_pandas_object(df.index).to_numpy())
+    for name in df.columns:
+        col = df[name]
+        sha.update(f"{name}:{col.dtype};".encode())
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            sha.update(pd.util.hash_pandas_object(col.cat.categories, index=False).to_numpy())
+            values = col.cat.codes.to_numpy()
+        elif col.dtype.kind in "biufM":
+            values = col.to_numpy()
+        else:
+            #the codes and the distinct values identify a string column, and are much cheaper than hashing every string
+            values, uniques = pd.factorize(col)
+            sha.update(repr(uniques.tolist()).encode())
+        sha.update(np.ascontiguousarray(values).view(np.uint8))
+    return sha.hexdigest()
+
+def _copy(df) -> pd.DataFrame:
+    """A copy of a remembered DataFrame the caller may change
+
+    With copy on write (always on since pandas 3) the copy shares the data and the remembered
+    DataFrame stays unchanged, without it an in place change would reach it, so the data are copied.
+    """
+    copyOnWrite = int(pd.__version__.split(".")[0]) >= 3 or pd.get_option("mode.copy_on_write") is True
+    return df.copy(deep=not copyOnWrite)
+
+def apply_plan(df) -> pd.DataFrame:
+    """Returns the DataFrame with the dtypes of PLAN and the derived columns, df isn't changed
+
+    The last result is remembered by the fingerprint of df, so converting the same data again
+    only costs hashing it.
+    """
+    global _applied
+    key = fingerprint(df)
+    if _applied[0] == key:
+        return _copy(_applied[1])
+
+    names = list(df.columns)
+    result = pd.DataFrame(_plan_columns(names, [df[name] for name in names], list(df.dtypes)), index=df.index, copy=False)
+
+    _applied = (key, result)
+    return _copy(result)
+
+def column_bytes(df, sample=10_000) -> dict:
+    """{column: bytes} of the DataFrame, without the index
+
+    The columns of numbers, dates and categoricals are the nbytes of their arrays. Object
+    columns are measured with memory_usage(deep=True), which visits every object, so only
+    an evenly spaced sample of `sample` rows is measured and scaled up (all rows with sample=None).
+    """
+    sizes = dict()
+    for name in df.columns:
+        col = df[name]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            sizes[name] = col.cat.codes.nbytes + int(col.cat.categories.memory_usage(deep=True))
+        elif col.dtype.kind in "biufmM" or col.dtype != object:
+            #the strings of the arrow backed columns are in the arrays too
+            sizes[name] = int(col.memory_usage(index=False, deep=True))
+        elif sample is None or len(col) <= sample:
+            sizes[name] = int(col.memory_usage(index=False, deep=True))
+        else:
+            sampled = col.iloc[::-(-len(col) // sample)]
+            sizes[name] = int(sampled.memory_usage(index=False, deep=True) * len(col) / len(sampled))
+    return sizes
+
+def memory_report(before, after, sample=10_000) -> list:
+    """Returns {"column", "dtype_before", "dtype", "bytes_before", "bytes", "ratio"} of every column of after
+
+    before is the DataFrame after was converted from, or None. ratio is bytes_before/bytes,
+    the columns added by the conversion have no bytes_before. See column_bytes for sample.
+    """
+    beforeBytes = column_bytes(before, sample) if before is not None else dict()
+    report = list()
+    for name, size in column_bytes(after, sample).items():
+        row = {"column":name, "dtype_before":None, "dtype":str(after[name].dtype), "bytes_before":beforeBytes.get(name), "bytes":size, "ratio":None}
+        if name in beforeBytes:
+            row["dtype_before"] = str(before[name].dtype)
+            row["ratio"] = beforeBytes[name] / size if size else None
+        report.append(row)
+    return report
+
+def _cell(value, width, precision=2) -> str:
+    return f"{value:>{width}.{precision}f}" if value is not None else " " * width
+
+def format_memory_report(report) -> str:
+    """The memory report as a text table, the totals in the last line"""
+    lines = [f"{'column':<10}{'dtype before':>16}{'dtype':>16}{'MB before':>12}{'MB':>10}{'ratio':>8}"]
+    for row in report:
+        mbBefore = row["bytes_before"] / 1_048_576 if row["bytes_before"] is not None else None
+        lines.append(f"{row['column']:<10}{row['dtype_before'] or '':>16}{row['dtype']:>16}"
+                     + _cell(mbBefore, 12) + _cell(row["bytes"] / 1_048_576, 10) + _cell(row["ratio"], 8, 1))
+    before = sum(row["bytes_before"] for row in report if row["bytes_before"] is not None) if any(row["bytes_before"] is not None for row in report) else None
+    after = sum(row["bytes"] for row in report)
+    lines.append(f"{'total':<42}" + _cell(before / 1_048_576 if before is not None else None, 12) + _cell(after / 1_048_576, 10)
+                 + _cell(before / after if before is not None and after else None, 8, 1))
+    return "\n".join(lines)
+
+def _encode_categories(dtype) -> dict:
+    """The categories of a CategoricalDtype as JSON"""
+    categories = dtype.categories
+    if isinstance(categories, pd.IntervalIndex):
+        return {"kind":"interval", "left":categories.left.tolist(), "right":categories.right.tolist(), "closed":categories.closed, "ordered":dtype.ordered}
+    values = categories.to_numpy()
+    if values.dtype.kind == "M":
+        return {"kind":"values", "dtype":str(values.dtype), "values":np.datetime_as_string(values).tolist(), "ordered":dtype.ordered}
+    return {"kind":"values", "dtype":str(values.dtype) if values.dtype.kind in "iuf" else "str", "values":values.tolist(), "ordered":dtype.ordered}
+
+def _decode_categories(info):
+    if info["kind"] == "interval":
+        return pd.IntervalIndex.from_arrays(info["left"], info["right"], closed=info["closed"])
+    return np.array(info["values"], dtype=info["dtype"] if info["dtype"] != "str" else object)
+
+def write_frame(filename, df, key=None):
+    """Writes the DataFrame into a .parquet or .feather file with its dtypes, key is stored along (see frame_key)
+
+    Neither format keeps every categorical (the interval ones are lost), so the categoricals
+    are stored as their integer codes and their categories in the schema metadata.
+    """
+    import pyarrow as pa
+    ext = os.path.splitext(filename)[1]
+    if ext not in FORMATS:
+        raise ValueError(f"Unknown frame format {ext}, expected one of {FORMATS}")
+
+    columns, categories, units = dict(), dict(), dict()
+    for name in df.columns:
+        col = df[name]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            columns[name] = col.cat.codes.to_numpy()
+            categories[name] = _encode_categories(col.dtype)
+        else:
+            columns[name] = col.to_numpy()
+            #parquet has no second timestamps
+            if columns[name].dtype.kind == "M":
+                units[name] = str(columns[name].dtype)
+    table = pa.table(columns)
+    metadata = {"version":VERSION, "key":key, "categories":categories, "units":units}
+    table = table.replace_schema_metadata({METADATA_KEY:json.dumps(metadata).encode()})
+
+    if ext == ".parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, f"{filename}.tmp")
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, f"{filename}.tmp")
+    os.replace(f"{filename}.tmp", filename)
+
+def _read_metadata(schema) -> dict:
+    metadata = json.loads((schema.metadata or {}).get(METADATA_KEY, b"{}"))
+    return metadata if metadata.get("version") == VERSION else None
+
+def frame_key(filename):
+    """The key a frame was written with, None if the file is missing or was written by another VERSION
+
+    Only the schema is read, not the data.
+    """
+    if not os.path.isfile(filename):
+        return None
+    if filename.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(filename)
+    else:
+        import pyarrow.ipc as ipc
+        with ipc.open_file(filename) as reader:
+            schema = reader.schema
+    metadata = _read_metadata(schema)
+    return metadata["key"] if metadata is not None else None
+
+def read_frame(filename, columns=None) -> pd.DataFrame:
+    """Reads the columns (all by default) of a DataFrame written by write_frame"""
+    if filename.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        table = pq.read_table(filename, columns=columns)
+    else:
+        import pyarrow.feather as feather
+        table = feather.read_table(filename, columns=columns)
+    metadata = _read_metadata(table.schema)
+    if metadata is None:
+        raise ValueError(f"{filename} wasn't written by write_frame version {VERSION}")
+
+    data = dict()
+    for name in table.column_names:
+        col = table.column(name).to_numpy()
+        info = metadata["categories"].get(name)
+        if info is not None:
+            col = _categorical(col, _decode_categories(info), info["ordered"])
+        elif name in metadata["units"]:
+            col = col.astype(metadata["units"][name], copy=False)
+        data[name] = col
+    return pd.DataFrame(data, copy=False)
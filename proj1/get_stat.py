@@ -1,25 +1,49 @@
 import logging
-import os, re, io, requests, datetime, operator
-import gzip, pickle, csv, zipfile, argparse
-from bs4 import BeautifulSoup
+import os, argparse
 import numpy as np
-import matplotlib.pyplot as plt
 
 from download import DataDownloader
+from profiling import Profiler
+import columnar, cube
 
 logging.basicConfig(level=logging.INFO)
 
-def plot_stat(data_source, fig_location = None, show_figure = False):
+def count_accidents(data_source) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Returns the regions, the years and the (regions, years) matrix of accident counts
+
+    data_source is the (names, columns) of DataDownloader.get_list or a cube of DataDownloader.get_cube.
+    Rows without a date are left out.
+    """
+    if isinstance(data_source, dict):
+        known = data_source["year"] >= 0
+        return cube.pivot({name:col[known] for name, col in data_source.items()}, "region", "year")
     names, data = data_source
 
-    regions = np.unique(data[names.index('region')])
-    yearArr = np.array(list(map(lambda x : getattr(x,"year"), data[names.index('p2a')])))
-    years = np.unique(yearArr) #get years
+    yearArr = columnar.years(data[names.index("p2a")])
+    known = yearArr >= 0
+    regions, regionCodes = np.unique(np.asarray(data[names.index('region')])[known], return_inverse=True)
+    years, yearCodes = np.unique(yearArr[known], return_inverse=True)
+
+    #count every (region, year) pair at once
+    counts = np.bincount(regionCodes.reshape(-1) * years.shape[0] + yearCodes.reshape(-1), minlength=regions.shape[0] * years.shape[0])
+    return regions, years, counts.reshape(regions.shape[0], years.shape[0])
 
-    fig, ax = plt.subplots(years.shape[0], sharex=False, sharey=True)
+def plot_stat(data_source, fig_location = None, show_figure = False, profiler=None):
+    profiler = profiler or Profiler(enabled=False)
+    with profiler.span("count_accidents"):
+        regions, years, counts = count_accidents(data_source)
+
+    #pyplot (and its GUI backend) is only imported to show the figure
+    if show_figure:
+        import matplotlib.pyplot as plt
+        fig = plt.figure()
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure()
+    ax = fig.subplots(years.shape[0], sharex=False, sharey=True)
     #force ax to be an array
     if not isinstance(ax, np.ndarray):
-        ax = np.array(ax)
+        ax = np.array([ax])
 
     #fig size
     fig.set_size_inches(w=8.2, h=20)
@@ -33,25 +57,20 @@ def plot_stat(data_source, fig_location = None, show_figure = False):
         #graph title
         ax[i].set_title(str(year))
 
-        yearMask = np.nonzero(yearArr == year)
-        accidentCounts = list()
-        for region in regions:
-            accidentCounts.append(data[names.index('region')][np.nonzero(data[names.index('region')][yearMask] == region)].shape[0])
-        
+        accidentCounts = counts[:, i]
+
         #plot accidents
         rects = ax[i].bar(regions, accidentCounts)
-        #rects = ax[i].bar(*zip(*sorted(zip(regions, accidentCounts), reverse=True, key=operator.itemgetter(1))))
 
-        #regions ordered by accident count
-        #orderedRegions, _ = zip(*sorted(zip(regions, accidentCounts), reverse=True, key=operator.itemgetter(1)))
-        orderedAccidentCounts = tuple(zip(*sorted(zip(regions, accidentCounts), reverse=True, key=operator.itemgetter(1))))
+        #position of every region in the country, 1 for the most accidents
+        order = np.argsort(-accidentCounts, kind="stable")
+        positions = np.empty_like(order)
+        positions[order] = np.arange(1, order.shape[0] + 1)
 
         #Anotate bars with accident position in country and the exact accident count
-        for rect, region in zip(rects, regions):
-            regionIndex = orderedAccidentCounts[0].index(region)+1 #add 1 to text because indexes start at 0
-            accidentCount = orderedAccidentCounts[1][regionIndex-1]
+        for rect, position, accidentCount in zip(rects, positions, accidentCounts):
             #position
-            ax[i].annotate(regionIndex, xy=(rect.get_x()+(rect.get_width()/2), rect.get_y()+rect.get_height()))
+            ax[i].annotate(position, xy=(rect.get_x()+(rect.get_width()/2), rect.get_y()+rect.get_height()))
 
             #accident count
             ax[i].annotate(accidentCount, xy=(rect.get_x(), rect.get_y()+(rect.get_height()/2)), color='white')
@@ -64,13 +83,14 @@ def plot_stat(data_source, fig_location = None, show_figure = False):
     if fig_location:
         if not os.path.isdir(os.path.dirname(fig_location)):
             os.makedirs(os.path.dirname(fig_location))
-        fig.savefig(fig_location)
+        with profiler.span("savefig"):
+            fig.savefig(fig_location)
     
     #show thegraph
     if show_figure:
         plt.show()
-    else:
-        return
+
+    return fig
 
 
 
@@ -80,9 +100,19 @@ if __name__ == "__main__":
 
     argParser.add_argument("--fig_location", default=None, required=False)
     argParser.add_argument("--show_figure", default=False, action='store_true')
+    argParser.add_argument("--profile", default=None, required=False, help="JSON file to write the stage timings into")
+    argParser.add_argument("--cprofile", default=[], nargs="*", help="stages to run under cProfile")
 
     args = argParser.parse_args()
 
     logging.debug(args.show_figure)
+    profiler = Profiler(enabled=args.profile is not None or bool(args.cprofile), profile=args.cprofile)
     #
-    plot_stat(DataDownloader().get_list(), fig_location=args.fig_location, show_figure=args.show_figure)
\ No newline at end of file
+    plot_stat(DataDownloader(profiler=profiler).get_cube(), fig_location=args.fig_location, show_figure=args.show_figure, profiler=profiler)
+
+    if profiler.enabled:
+        logging.info("Stage timings:\n" + profiler.table())
+        for name in profiler.profiles:
+            logging.info(f"cProfile of {name}:\n" + profiler.profile_report(name))
+    if args.profile:
+        profiler.to_json(args.profile)
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""Row filters of get_list
+
+A filter is a dict {column: condition}, where a condition is one of
+    (low, high)     a range with inclusive bounds, None for an open end
+    [a, b, ...]     one of the values (a set works too)
+    value           equality
+Dates are given as datetime64, datetime.date or "YYYY-MM-DD" strings.
+
+Chunks of rows whose zone map (see colcache.zone_map) can't match the filter
+are skipped without being read.
+"""
+import numpy as np
+
+from dictcol import DictColumn
+
+def _value(value, dtype):
+    if np.dtype(dtype).kind == "M":
+        return np.datetime64(value, "D")
+    return value
+
+def _zone_value(value):
+    """Zone maps hold dates as days since 1970-01-01"""
+    if isinstance(value, np.datetime64):
+        return int(value.astype(np.int64))
+    return value
+
+def normalize_where(where, colTypes) -> dict:
+    """Returns {column: ("range", low, high) or ("in", values)} with values converted to the column dtypes"""
+    normalized = dict()
+    for name, condition in (where or dict()).items():
+        dtype = colTypes[name]
+        if isinstance(condition, tuple):
+            low, high = condition
+            normalized[name] = ("range", None if low is None else _value(low, dtype), None if high is None else _value(high, dtype))
+        elif isinstance(condition, (list, set, frozenset, np.ndarray)):
+            normalized[name] = ("in", np.array([_value(value, dtype) for value in condition], dtype=dtype))
+        else:
+            normalized[name] = ("in", np.array([_value(condition, dtype)], dtype=dtype))
+    return normalized
+
+def chunk_mask(zones, where, nchunks) -> np.ndarray:
+    """Mask of the chunks that may hold rows matching the normalized filter"""
+    keep = np.ones(nchunks, dtype=bool)
+    for name, condition in where.items():
+        columnZones = zones.get(name)
+        if columnZones is None or len(columnZones) != nchunks:
+            continue
+        #NaT and empty chunks never match
+        known = np.array([zone is not None for zone in columnZones])
+        mins, maxs = np.array([zone if zone is not None else [0, 0] for zone in columnZones], dtype=np.int64).reshape(-1, 2).T
+        if condition[0] == "range":
+            _, low, high = condition
+            matching = known.copy()
+            if low is not None:
+                matching &= maxs >= _zone_value(low)
+            if high is not None:
+                matching &= mins <= _zone_value(high)
+        else:
+            values = condition[1].astype(np.int64) if condition[1].dtype.kind == "M" else condition[1]
+            matching = known & ((values[None, :] >= mins[:, None]) & (values[None, :] <= maxs[:, None])).any(axis=1)
+        keep &= matching
+    return keep
+
+def row_mask(data, where) -> np.ndarray:
+    """Mask of the rows of the columns in `data` matching the normalized filter"""
+    mask = None
+    for name, condition in where.items():
+        col = data[name]
+        if condition[0] == "range":
+            _, low, high = condition
+            matching = np.ones(col.shape[0], dtype=bool) if low is None else col >= low
+            if high is not None:
+                matching &= col <= high
+            if col.dtype.kind == "M":
+                matching &= ~np.isnat(col)
+        elif isinstance(col, DictColumn):
+            matching = col.isin(condition[1])
+        else:
+            matching = np.isin(col, condition[1])
+        mask = matching if mask is None else mask & matching
+    return mask
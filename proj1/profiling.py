@@ -0,0 +1,155 @@
+"""Timing of the pipeline stages
+
+A Profiler records named spans:
+
+    with profiler.span("parse", region="PHA") as span:
+        ...
+        span["rows"] = rows
+
+Every span gets its wall time, its nesting depth, the peak memory and whatever the stage
+reports ("rows", "bytes_read", "bytes_written"). The peak memory is the peak RSS of the
+process by default (since the last reset_peak_rss() on Linux, None on Windows), or the peak of memory
+allocated during the span with memory="tracemalloc" (exact, but it slows the stages down).
+Stages named in `profile` also run under cProfile.
+A disabled Profiler (the default of DataDownloader) records nothing and costs next to nothing.
+"""
+import sys, time, json, tracemalloc, io
+from contextlib import contextmanager
+
+def reset_peak_rss() -> bool:
+    """Resets the peak peak_rss() returns to the current resident set size, where the system allows it (Linux)
+
+    Returns False when it can't be reset, peak_rss() is then the peak of the whole process.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as fout:
+            fout.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss() -> float:
+    """Returns the peak resident set size in MB since the last reset_peak_rss() (or of the process),
+    None where it isn't known (Windows)"""
+    try:
+        with open("/proc/self/status") as fin:
+            for line in fin:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    #ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1_048_576 if sys.platform == "darwin" else 1024)
+
+#columns of table(), in this order
+FIELDS = ["seconds", "rows", "bytes_read", "bytes_written", "peak_mb"]
+
+class Profiler:
+    def __init__(self, enabled=True, memory="rss", profile=()):
+        """
+        memory is "rss" or "tracemalloc", see the module docstring.
+        profile are the names of the spans to run under cProfile, True for all of them.
+        """
+        self.enabled = enabled
+        self.memory = memory
+        self.profile = profile
+        self.spans = list()
+        self.profiles = dict() #span name -> pstats.Stats, summed over the spans with that name
+        self._stack = list()
+        self._profiling = False
+
+    def _wants_profile(self, name) -> bool:
+        return not self._profiling and (self.profile is True or name in self.profile)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Records the stage `name` with attrs (like region="PHA"), yields the span dict to add counts to"""
+        if not self.enabled:
+            yield dict()
+            return
+
+        span = {"name":name, "depth":len(self._stack), **attrs}
+        self.spans.append(span)
+
+        if self.memory == "tracemalloc":
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            #the peak is reset for this span, the enclosing one keeps its own peak so far
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], peak)
+            tracemalloc.reset_peak()
+            span["_start"], span["_peak"] = current, current
+
+        profiler = None
+        if self._wants_profile(name):
+            import cProfile
+            profiler, self._profiling = cProfile.Profile(), True
+            profiler.enable()
+
+        self._stack.append(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span["seconds"] = time.perf_counter() - start
+            self._stack.pop()
+
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                if name in self.profiles:
+                    self.profiles[name].add(profiler)
+                else:
+                    import pstats
+                    self.profiles[name] = pstats.Stats(profiler)
+
+            if self.memory == "tracemalloc":
+                peak = max(span.pop("_peak"), tracemalloc.get_traced_memory()[1])
+                span["peak_mb"] = (peak - span.pop("_start"))/1_048_576
+                if self._stack:
+                    self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], peak)
+                else:
+                    tracemalloc.stop()
+            else:
+                span["peak_mb"] = peak_rss()
+
+    def reset(self):
+        self.spans = list()
+        self.profiles = dict()
+
+    def to_json(self, filename=None) -> str:
+        """Returns the spans as JSON and writes them into filename if given"""
+        text = json.dumps(self.spans, indent=4, default=str)
+        if filename:
+            with open(filename, "w") as fout:
+                fout.write(text)
+        return text
+
+    def table(self) -> str:
+        """Returns the spans as a flat text table, nested spans are indented"""
+        lines = [f"{'stage':<40}" + "".join(f"{field:>15}" for field in FIELDS)]
+        for span in self.spans:
+            attrs = ",".join(f"{key}={value}" for key, value in span.items() if key not in FIELDS and key not in ("name", "depth"))
+            label = "  " * span["depth"] + span["name"] + (f"[{attrs}]" if attrs else "")
+            cells = [f"{span[field]:>15.3f}" if isinstance(span.get(field), float) else f"{'' if span.get(field) is None else span[field]:>15}" for field in FIELDS]
+            lines.append(f"{label:<40}" + "".join(cells))
+        return "\n".join(lines)
+
+    def profile_report(self, name, limit=20, sort="cumulative") -> str:
+        """Returns the top `limit` functions of the cProfile stats of the spans named `name`"""
+        out = io.StringIO()
+        stats = self.profiles[name]
+        stats.stream = out
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def dump_profiles(self, folder):
+        """Writes the cProfile stats into {folder}/{name}.prof, for snakeviz or pstats"""
+        for name, stats in self.profiles.items():
+            stats.dump_stats(f"{folder}/{name}.prof")
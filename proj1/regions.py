@@ -0,0 +1,19 @@
+"""The regions of the accident data, shared by the downloader and the DataFrame dtypes"""
+
+#file names in the yearly archives and the acronyms of their regions
+FILE_REGIONS = {
+    "00.csv":"PHA",
+    "01.csv":"STC",
+    "02.csv":"JHC",
+    "03.csv":"PLK",
+    "04.csv":"ULK",
+    "05.csv":"HKK",
+    "06.csv":"JHM",
+    "07.csv":"MSK",
+    "14.csv":"OLK",
+    "15.csv":"ZLK",
+    "16.csv":"VYS",
+    "17.csv":"PAK",
+    "18.csv":"LBK",
+    "19.csv":"KVK"
+}
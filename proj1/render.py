@@ -0,0 +1,175 @@
+"""Headless batch rendering of the figures of all projects
+
+A job is a dict {"plot": name, "output": filename} with the optional "regions" and "years"
+the figure is drawn from (all of them by default), for example
+    {"plot": "plot_surface", "output": "figs/surface_2020.png", "years": [2020]}
+The regions of a job must include the PLOT_REGIONS its plot draws.
+render() draws the jobs on a process pool with the Agg backend and saves the Figure every plot
+function returns. A job is skipped when its output was rendered from the same region files with
+the same parameters, each output has a {output}.json with the digest of both.
+"""
+import os, sys, json, time, hashlib, argparse, importlib.util
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from download import DataDownloader
+import columnar, cube
+
+#bump when the plot functions change, so every figure is rendered again
+VERSION = 1
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+#plot: (module file, data it is drawn from, function preparing the data, savefig arguments)
+#"cube" plots get DataDownloader.get_cube, "rows" plots a DataFrame of DataDownloader.get_list
+PLOTS = {
+    "plot_stat":("proj1/get_stat.py", "cube", None, {}),
+    "plot_conseq":("proj2/analysis.py", "cube", None, {}),
+    "plot_damage":("proj2/analysis.py", "cube", None, {}),
+    "plot_surface":("proj2/analysis.py", "cube", None, {"bbox_inches":"tight"}),
+    "plot_geo":("proj3/geo.py", "rows", "make_geo", {}),
+}
+
+#regions the plots draw whatever data they get, the jobs of these plots must include them
+PLOT_REGIONS = {
+    "plot_damage":["PHA", "HKK", "JHM", "PLK"],
+    "plot_surface":["PHA", "HKK", "JHM", "PLK"],
+    "plot_geo":["JHM"],
+}
+
+def _load_module(filename):
+    """Loads a module of one of the projects from its path, they aren't packages"""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _job_regions(downloader, job) -> list:
+    return job.get("regions") or list(downloader._region2fileDict.keys())
+
+def job_digest(downloader, job) -> str:
+    """Hash of the job parameters and of the region files it is drawn from"""
+    inputs = {region:downloader.source_digest(region) for region in _job_regions(downloader, job)}
+    content = json.dumps({"version":VERSION, "job":job, "inputs":inputs}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def _is_rendered(job, digest) -> bool:
+    """Checks that the output exists and was rendered with the same digest"""
+    digestFilename = f"{job['output']}.json"
+    if not (os.path.isfile(job["output"]) and os.path.isfile(digestFilename)):
+        return False
+    with open(digestFilename) as fin:
+        return json.load(fin).get("digest") == digest
+
+def _job_data(downloader, job, source):
+    """The data a plot is drawn from, restricted to the job regions and years"""
+    regions = _job_regions(downloader, job)
+    years = job.get("years")
+    if source == "cube":
+        data = downloader.get_cube(regions)
+        if years is not None:
+            keep = np.isin(data["year"], years)
+            data = {name:col[keep] for name, col in data.items()}
+        return data
+
+    import pandas as pd
+    names, columns = downloader.get_list(regions)
+    data = dict(zip(names, columns))
+    keep = np.isin(columnar.years(data["p2a"]), years) if years is not None else slice(None)
+    #the plots compare the regions with str
+    return pd.DataFrame({name:np.char.decode(np.asarray(col[keep]), "latin1") if name == "region" else np.asarray(col[keep]) for name, col in data.items()})
+
+def _render_job(downloaderArgs, job, digest) -> dict:
+    """Process pool worker of render, draws a single job"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    start = time.perf_counter()
+    filename, source, prepare, savefigArgs = PLOTS[job["plot"]]
+    module = _load_module(filename)
+    data = _job_data(DataDownloader(*downloaderArgs), job, source)
+    if prepare is not None:
+        data = getattr(module, prepare)(data)
+
+    fig = getattr(module, job["plot"])(data)
+    output = job["output"]
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    #savefig takes the format from the extension, so it is kept on the temporary file
+    root, ext = os.path.splitext(output)
+    fig.savefig(f"{root}.tmp{ext}", **savefigArgs)
+    plt.close(fig)
+    os.replace(f"{root}.tmp{ext}", output)
+
+    with open(f"{output}.json.tmp", "w") as fout:
+        json.dump({"digest":digest, "job":job}, fout)
+    os.replace(f"{output}.json.tmp", f"{output}.json")
+
+    return {"output":output, "skipped":False, "seconds":time.perf_counter() - start}
+
+def render(jobs, workers=4, downloader=None, force=False) -> list:
+    """Renders the figure jobs on `workers` processes, returns a report per job
+
+    A report is {"output", "skipped", "seconds"}, or {"output", "error"} for a job that failed.
+    Jobs already rendered from the same data are skipped unless force=True. A job whose regions
+    leave out one of the PLOT_REGIONS of its plot raises ValueError before anything is rendered.
+    """
+    downloader = downloader or DataDownloader()
+    for job in jobs:
+        if job["plot"] not in PLOTS:
+            raise ValueError(f"Unknown plot {job['plot']}, expected one of {list(PLOTS.keys())}")
+        missing = sorted(set(PLOT_REGIONS.get(job["plot"], [])) - set(_job_regions(downloader, job)))
+        if missing:
+            raise ValueError(f"{job['plot']} draws the regions {missing} the job of {job['output']} leaves out")
+
+    #build the missing caches and cubes once here, not in every worker
+    cubeRegions = sorted({region for job in jobs if PLOTS[job["plot"]][1] == "cube" for region in _job_regions(downloader, job)})
+    rowRegions = sorted({region for job in jobs if PLOTS[job["plot"]][1] == "rows" for region in _job_regions(downloader, job)})
+    if cubeRegions:
+        downloader._build_caches(cubeRegions, workers, cube.COLUMNS)
+        downloader.get_cube(cubeRegions)
+    if rowRegions:
+        downloader._build_caches(rowRegions, workers)
+
+    reports = [None] * len(jobs)
+    pending = list()
+    for i, job in enumerate(jobs):
+        digest = job_digest(downloader, job)
+        if not force and _is_rendered(job, digest):
+            reports[i] = {"output":job["output"], "skipped":True, "seconds":0.0}
+        else:
+            pending.append((i, job, digest))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(i, job, executor.submit(_render_job, downloader.worker_args(), job, digest)) for i, job, digest in pending]
+            for i, job, future in futures:
+                try:
+                    reports[i] = future.result()
+                except Exception as e:
+                    reports[i] = {"output":job["output"], "error":f"{type(e).__name__}: {e}"}
+
+    return reports
+
+def main():
+    argParser = argparse.ArgumentParser(description="Renders the figure jobs of a JSON file, see render")
+    argParser.add_argument("jobs", help="JSON file with a list of jobs")
+    argParser.add_argument("--folder", default="data")
+    argParser.add_argument("--workers", type=int, default=4)
+    argParser.add_argument("--force", default=False, action='store_true')
+    args = argParser.parse_args()
+
+    with open(args.jobs) as fin:
+        jobs = json.load(fin)
+
+    for report in render(jobs, args.workers, DataDownloader(folder=args.folder), args.force):
+        if "error" in report:
+            print(f"{report['output']}: {report['error']}", file=sys.stderr)
+        elif report["skipped"]:
+            print(f"{report['output']}: up to date")
+        else:
+            print(f"{report['output']}: rendered in {report['seconds']:.2f} s")
+
+if __name__ == "__main__":
+    main()
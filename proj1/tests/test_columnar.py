@@ -0,0 +1,41 @@
+"""The columnar engine of parse_region_data against np.genfromtxt
+
+Run with `python -m pytest tests` from proj1.
+"""
+import sys, os
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from download import DataDownloader
+from benchmark.generate import generate_region
+import columnar
+
+@pytest.fixture(scope="module")
+def downloader(tmp_path_factory):
+    """A DataDownloader of two generated regions, with malformed rows, the time sentinels and missing values"""
+    folder = str(tmp_path_factory.mktemp("data"))
+    downloader = DataDownloader(folder=folder)
+    for seed, region in enumerate(["PHA", "JHM"]):
+        generate_region(f"{folder}/data_{region}.csv", downloader._colTypes, 5000, seed=seed, malformed=0.01)
+    return downloader
+
+#genfromtxt warns about the malformed rows it leaves out
+@pytest.mark.filterwarnings("ignore:Some errors were detected")
+@pytest.mark.parametrize("region", ["PHA", "JHM"])
+def test_columnar_matches_genfromtxt(downloader, region):
+    expectedNames, expected = downloader.parse_region_data(region, engine="genfromtxt")
+    names, columns = downloader.parse_region_data(region, engine="columnar")
+
+    assert names == expectedNames
+    for name, col, expectedCol in zip(names, columns, expected):
+        col, expectedCol = np.asarray(col), np.asarray(expectedCol)
+        assert col.dtype == expectedCol.dtype, name
+        assert np.array_equal(col, expectedCol, equal_nan=col.dtype.kind in "fM"), name
+
+def test_times_keep_the_hour_of_an_unknown_minute():
+    codes = np.array([columnar.time_converter(cell) for cell in [b'"0930"', b'"1260"', b'"2515"', b'"2560"', b'"2400"']], dtype=np.int16)
+    assert columnar.hours(codes).tolist() == [9, 12, -1, -1, -1]
+    assert columnar.time_unknown(codes).tolist() == [False, False, True, True, True]
+    assert columnar.minute_unknown(codes).tolist() == [False, True, False, False, False]
+    assert codes[0] == 9*60 + 30
@@ -0,0 +1,136 @@
+"""DataDownloader and AsyncDataDownloader against a local http.server stand-in of the index page
+
+Run with `python -m pytest tests` from proj1.
+"""
+import sys, os, io, json, asyncio, threading, zipfile, functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from download import DataDownloader
+
+#{archive: {file in the archive: content}}, 2016 is listed twice and only the december archive is used
+ARCHIVES = {
+    "data-2016-01.zip":{"00.csv":b"stale\n"},
+    "data-2016-12.zip":{"00.csv":b"PHA 2016 a\nPHA 2016 b\n", "06.csv":b"JHM 2016\n", "99.csv":b"not a region\n"},
+    "data-2017-06.zip":{"00.csv":b"PHA 2017\n", "06.csv":b"JHM 2017 a\nJHM 2017 b\n"},
+}
+INDEX = """<html><body><table>
+<tr><td>Leden 2016</td><td><a href="data-2016-01.zip">ZIP</a></td></tr>
+<tr><td>Prosinec 2016</td><td><a href="data-2016-12.zip">ZIP</a></td></tr>
+<tr><td>Červen 2017</td><td><a href="data-2017-06.zip">ZIP</a></td></tr>
+</table></body></html>"""
+#the region files the archives above should produce
+REGION_FILES = {
+    "PHA":b"PHA 2016 a\nPHA 2016 b\nPHA 2017\n",
+    "JHM":b"JHM 2016\nJHM 2017 a\nJHM 2017 b\n",
+}
+
+class IndexHandler(SimpleHTTPRequestHandler):
+    """Serves the site folder, GET requests of `hold` wait until `release` is set"""
+    hold = None
+    requested = None
+    release = None
+    extensions_map = {**SimpleHTTPRequestHandler.extensions_map, ".html":"text/html; charset=utf-8"}
+
+    def do_GET(self):
+        if self.path == f"/{self.hold}":
+            self.requested.set()
+            self.release.wait(10)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def site(tmp_path):
+    """Starts a server of the index page and the archives, yields its url and the handler class"""
+    siteFolder = tmp_path / "site"
+    siteFolder.mkdir()
+    (siteFolder / "index.html").write_text(INDEX, encoding="utf-8")
+    for name, files in ARCHIVES.items():
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            for filename, content in files.items():
+                zf.writestr(filename, content)
+        (siteFolder / name).write_bytes(buffer.getvalue())
+
+    handler = type("Handler", (IndexHandler,), {"requested":threading.Event(), "release":threading.Event()})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=str(siteFolder)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/", handler
+    handler.release.set()
+    server.shutdown()
+    server.server_close()
+
+def _async_downloader(*args, **kwargs):
+    pytest.importorskip("aiohttp")
+    from async_download import AsyncDataDownloader
+    return AsyncDataDownloader(*args, **kwargs)
+
+def _region_files(folder) -> dict:
+    return {region:(folder / f"data_{region}.csv").read_bytes() for region in REGION_FILES if (folder / f"data_{region}.csv").exists()}
+
+@pytest.mark.parametrize("backend", [DataDownloader, _async_downloader])
+def test_download_builds_region_files(site, tmp_path, backend):
+    url, _ = site
+    folder = tmp_path / "data"
+    reports = backend(url, folder=str(folder)).download_data(workers=2, backoff=0)
+
+    assert [report["url"] for report in reports] == [url + "data-2016-12.zip", url + "data-2017-06.zip"]
+    assert not any(report["skipped"] for report in reports)
+    assert _region_files(folder) == REGION_FILES
+    manifest = json.loads((folder / "manifest.json").read_text())
+    assert sorted(manifest) == ["2016", "2017"]
+    assert all(sorted(entry["regions"]) == ["JHM", "PHA"] for entry in manifest.values())
+
+def test_backends_write_identical_files(site, tmp_path):
+    url, _ = site
+    DataDownloader(url, folder=str(tmp_path / "sync")).download_data(workers=2, backoff=0)
+    _async_downloader(url, folder=str(tmp_path / "async")).download_data(workers=2, backoff=0)
+
+    assert _region_files(tmp_path / "sync") == _region_files(tmp_path / "async") == REGION_FILES
+
+@pytest.mark.parametrize("backend", [DataDownloader, _async_downloader])
+def test_second_download_skips_every_archive(site, tmp_path, backend):
+    url, _ = site
+    folder = tmp_path / "data"
+    backend(url, folder=str(folder)).download_data(workers=2, backoff=0)
+    manifest = (folder / "manifest.json").read_bytes()
+
+    reports = backend(url, folder=str(folder)).download_data(workers=2, backoff=0)
+
+    assert all(report["skipped"] and report["bytes"] == 0 for report in reports)
+    assert (folder / "manifest.json").read_bytes() == manifest
+    assert _region_files(folder) == REGION_FILES
+
+def test_cancelled_download_leaves_manifest_unwritten(site, tmp_path):
+    url, handler = site
+    handler.hold = "data-2017-06.zip"
+    folder = tmp_path / "data"
+    downloader = _async_downloader(url, folder=str(folder))
+
+    async def cancel():
+        task = asyncio.create_task(downloader.download_data_async(concurrency=2, backoff=0))
+        assert await asyncio.to_thread(handler.requested.wait, 10)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+
+    assert not (folder / "manifest.json").exists()
+    assert _region_files(folder) == {}
+
+def test_failed_download_leaves_manifest_unwritten(site, tmp_path):
+    requests = pytest.importorskip("requests")
+    url, _ = site
+    (tmp_path / "site" / "data-2017-06.zip").unlink()
+    folder = tmp_path / "data"
+
+    with pytest.raises(requests.HTTPError):
+        DataDownloader(url, folder=str(folder)).download_data(workers=2, retries=2, backoff=0)
+
+    assert not (folder / "manifest.json").exists()
+    assert _region_files(folder) == {}
@@ -0,0 +1,41 @@
+"""The dtypes of frame.PLAN on pickles like the ones of DataDownloader.get_list
+
+Run with `python -m pytest tests` from proj1.
+"""
+import sys, os
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import frame
+
+def _pickled() -> pd.DataFrame:
+    """Accidents with byte string regions and the -1 defaults of the parser"""
+    return pd.DataFrame({
+        "region":np.array([b"PHA", b"JHM", b"PHA", None], dtype=object),
+        "p16":[-1, 3, 4, 5],
+        "weekday":[-1, 0, 6, 1],
+        "p5a":[1, 2, -1, 1],
+    })
+
+def test_apply_plan_decodes_byte_string_regions():
+    df = frame.apply_plan(_pickled())
+    assert df["region"].tolist()[:3] == ["PHA", "JHM", "PHA"]
+    assert df["region"].isna().tolist() == [False, False, False, True]
+    assert list(df["region"].cat.categories) == sorted(frame.FILE_REGIONS.values())
+
+def test_apply_plan_keeps_values_outside_of_the_levels():
+    df = frame.apply_plan(_pickled())
+    for name in ["p16", "weekday", "p5a"]:
+        assert df[name].notna().all(), name
+        assert -1 in df[name].cat.categories, name
+    assert df["p16"].tolist() == [-1, 3, 4, 5]
+
+def test_apply_plan_result_changes_dont_reach_the_memo():
+    pickled = _pickled()
+    first = frame.apply_plan(pickled)
+    first.loc[0, "p5a"] = 2
+    first["p16"] = 0
+    again = frame.apply_plan(pickled)
+    assert again.loc[0, "p5a"] == 1
+    assert again["p16"].tolist() == [-1, 3, 4, 5]
@@ -0,0 +1,16 @@
+"""Import time of the warm cache path, see benchmark.imports
+
+Run with `python -m pytest tests` from proj1.
+"""
+import sys, os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from benchmark.imports import import_time, heavy_imports, BUDGET
+
+def test_warm_path_imports_no_heavy_modules():
+    assert heavy_imports() == []
+
+def test_warm_path_import_time_is_within_budget():
+    #the best of a few runs, like the command line check
+    seconds = min(import_time()[0] for _ in range(3))
+    assert seconds <= BUDGET
@@ -0,0 +1,56 @@
+"""Memory of DataDownloader.iter_chunks, the check of benchmark.suite.benchmark_iter_chunks
+
+Run with `python -m pytest tests` from proj1.
+"""
+import sys, os, tracemalloc
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from download import DataDownloader
+from benchmark.generate import generate_dataset
+
+REGIONS = ["PHA", "STC", "JHM", "PLK"]
+ROWS = 40_000
+CHUNK_ROWS = 1024
+
+def _generate(tmp_path_factory) -> str:
+    """Region files of REGIONS with ROWS rows in total"""
+    folder = str(tmp_path_factory.mktemp("data"))
+    generate_dataset(folder, DataDownloader(folder=folder)._colTypes, REGIONS, ROWS)
+    return folder
+
+@pytest.fixture(scope="module")
+def csvFolder(tmp_path_factory):
+    return _generate(tmp_path_factory)
+
+@pytest.fixture(scope="module")
+def npyFolder(tmp_path_factory):
+    folder = _generate(tmp_path_factory)
+    DataDownloader(folder=folder).get_list(REGIONS)
+    return folder
+
+def _stream(folder, regions) -> (int, float):
+    """Streams the regions with a new DataDownloader, returns the rows and the peak of memory allocated in MB"""
+    downloader = DataDownloader(folder=folder)
+    rows = 0
+    tracemalloc.start()
+    try:
+        for _, chunk in downloader.iter_chunks(regions, CHUNK_ROWS):
+            rows += chunk[0].shape[0]
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return rows, peak/1_048_576
+
+def _assert_peak_independent_of_rows(folder):
+    oneRows, onePeak = _stream(folder, REGIONS[:1])
+    allRows, allPeak = _stream(folder, REGIONS)
+    assert allRows > 3.9 * oneRows
+    #four times the rows may cost at most 20 % and 1 MB more than one region, kept in memory they would cost four times as much
+    assert allPeak <= 1.2 * onePeak + 1, (onePeak, allPeak)
+
+def test_streaming_region_files_peak_is_independent_of_rows(csvFolder):
+    _assert_peak_independent_of_rows(csvFolder)
+
+def test_streaming_npy_caches_peak_is_independent_of_rows(npyFolder):
+    _assert_peak_independent_of_rows(npyFolder)
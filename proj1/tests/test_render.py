@@ -0,0 +1,21 @@
+"""render jobs, checked before anything is rendered
+
+Run with `python -m pytest tests` from proj1.
+"""
+import sys, os
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from download import DataDownloader
+import render
+
+@pytest.mark.parametrize("plot, regions", [("plot_surface", ["PHA", "JHM"]), ("plot_damage", ["HKK"]), ("plot_geo", ["PHA"])])
+def test_render_rejects_jobs_without_the_plot_regions(tmp_path, plot, regions):
+    job = {"plot":plot, "output":str(tmp_path / f"{plot}.png"), "regions":regions}
+    with pytest.raises(ValueError, match="leaves out"):
+        render.render([job], workers=1, downloader=DataDownloader(folder=str(tmp_path / "data")))
+    assert not os.path.exists(job["output"])
+
+def test_render_rejects_unknown_plots(tmp_path):
+    with pytest.raises(ValueError, match="Unknown plot"):
+        render.render([{"plot":"plot_nothing", "output":str(tmp_path / "nothing.png")}], workers=1, downloader=DataDownloader(folder=str(tmp_path / "data")))
@@ -8,78 +8,100 @@ import numpy as np
 import os
 # muzete pridat libovolnou zakladni knihovnu ci knihovnu predstavenou na prednaskach
 # dalsi knihovny pak na dotaz
-import gzip, pickle
-from pympler import asizeof
+import gzip, pickle, functools, contextlib, sys
+
+#the dtypes of the accident columns (proj1/frame.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "proj1"))
+import frame
+
+def _span(profiler, name, **attrs):
+    """profiler.span (see proj1/profiling.py), nothing without a profiler"""
+    return profiler.span(name, **attrs) if profiler is not None else contextlib.nullcontext(dict())
+
+def _profiled(plot):
+    """Records a plot function as a span of the `profiler` keyword argument"""
+    @functools.wraps(plot)
+    def wrapper(df, *args, profiler=None, **kwargs):
+        with _span(profiler, plot.__name__) as span:
+            span["rows"] = len(df["count"] if isinstance(df, dict) else df)
+            return plot(df, *args, **kwargs)
+    return wrapper
 
 # Ukol 1: nacteni dat
-def get_dataframe(filename: str, verbose: bool = False) -> pd.DataFrame:
-    orig_size = 0
-    new_size = 0
+def get_dataframe(filename: str, verbose: bool = False, profiler=None) -> pd.DataFrame:
+    """Reads the pickled accidents and converts their dtypes
+
+    A .parquet or .feather file written by DataDownloader.get_dataframe already has the final
+    dtypes and is returned as it is read.
+    """
+    if filename.endswith(frame.FORMATS):
+        with _span(profiler, "read_frame") as span:
+            df = frame.read_frame(filename)
+            span.update(rows=len(df), bytes_read=os.path.getsize(filename))
+        if verbose:
+            print(frame.format_memory_report(frame.memory_report(None, df)))
+        return df
+
     #read pickled data
-    df = pd.read_pickle(filename)
-    if verbose:
-        orig_size = asizeof.asizeof(df)/1_048_576
-
-    #add date column
-    df['date'] = pd.to_datetime(df['p2a'])
-
-    #get columns to convert to categories
-    # We don't want to categorize:
-    #   p1(id), date and region
-    #   float data
-    #   p2a(date), p2b(time)
-    #   p13a(deaths), p13b(heavy injuries), p13c (light injuries)
-    #   p14(total material damage(in czk))
-    #   p34(nubmer of vehicles)
-    #   p47(vehicle make year)(maybe?)
-
-    # We also don't want to automaticaly categorize:
-    #   p12(accident cause) - we want to bin this by main causes
-    #   p53(vehicle damage (in hundreds of czk)) - bin
-
-    #get column names
-    convertColsNames = list(df.select_dtypes(exclude='float32').columns)
-    convertColsNames.remove('p1')
-    convertColsNames.remove('date')
-    convertColsNames.remove('region')
-    #convertColsNames.remove('p2a')
-    #convertColsNames.remove('p2b')
-    convertColsNames.remove('p12')
-    convertColsNames.remove('p13a')
-    convertColsNames.remove('p13b')
-    convertColsNames.remove('p13c')
-    convertColsNames.remove('p14')
-    #convertColsNames.remove('p34')
-    convertColsNames.remove('p53')
-
-    #Automatic categorization
-    df[convertColsNames] = df[convertColsNames].astype('category')
-
-    #Manual categorizations
-    # accidentCauseBins = pd.IntervalIndex.from_tuples((100,200), (201,300), (301,400), (401,500), (501,600), (601,700), closed='both')
-    accidentCauseBins = [100,200,300,400,500,600,700]
-    accidentCauseLabels = [
-        "nezaviněná řidičem",
-        "nepřiměřená rychlost jízdy",
-        "nesprávné předjíždění",
-        "nedání přednosti v jízdě",
-        "nesprávný způsob jízdy",
-        "technická závada vozidla"
-    ]
-    df["p12"] = pd.cut(df["p12"], bins=accidentCauseBins, labels=accidentCauseLabels, include_lowest=True, right=False, ordered=False)
-
-    vehicleDamageBins =  [0,50,200,500,1000,float("inf")]
-    df["p53"] = pd.cut(df["p53"], bins=vehicleDamageBins, include_lowest=True)
+    with _span(profiler, "read_pickle") as span:
+        df = pd.read_pickle(filename)
+        span.update(rows=len(df), bytes_read=os.path.getsize(filename))
+    orig = df
+
+    #the dtypes of every column are declared in proj1/frame.py
+    with _span(profiler, "apply_plan", rows=len(df)):
+        df = frame.apply_plan(df)
 
     if verbose:
-        new_size = asizeof.asizeof(df)/1_048_576
-        print(f"{orig_size=:.2f} MB\n{new_size=:.2f} MB")
+        #per column sizes from the array sizes, nothing walks the Python objects
+        print(frame.format_memory_report(frame.memory_report(orig, df)))
 
     return df
 
+def _cube_frame(cube: dict, by: list, regions: list = None) -> pd.DataFrame:
+    """Sums a cube of DataDownloader.get_cube over the `by` dimensions, optionally only for some regions"""
+    cubeDf = pd.DataFrame(cube)
+    #the cube holds the regions as byte strings
+    cubeDf["region"] = np.char.decode(cube["region"], "ascii")
+    if regions is not None:
+        cubeDf = cubeDf[cubeDf["region"].isin(regions)]
+    return cubeDf.groupby(by, sort=True).sum(numeric_only=True)
+
+#index of the accident_stats table
+STATS_INDEX = ["region", "p12", "p53"]
+
+def accident_stats(df) -> pd.DataFrame:
+    """Accident counts and the sums of deaths (p13a), heavy (p13b) and light injuries (p13c)
+    per region, cause (p12) and damage bin (p53)
+
+    df is the DataFrame of get_dataframe or a cube of DataDownloader.get_cube. The rows are
+    aggregated in a single groupby().agg() pass, the causes and damages outside of the bins
+    keep their own NaN groups, so the table still sums up to every accident. plot_conseq
+    and plot_damage are drawn from it, however many rows it was aggregated from.
+    """
+    measures = ["count", "p13a", "p13b", "p13c"]
+    if isinstance(df, dict):
+        #the cube is summed already, its cause groups and damage bins are the codes of the plan labels
+        cells = _cube_frame(df, ["region", "cause", "damage"])[measures].reset_index()
+        stats = cells[measures].set_index(pd.MultiIndex.from_arrays([
+            cells["region"],
+            pd.Categorical.from_codes(cells["cause"], frame.CAUSE_LABELS),
+            pd.Categorical.from_codes(cells["damage"], frame.DAMAGE_LABELS, ordered=True),
+        ], names=STATS_INDEX))
+    else:
+        stats = df.groupby(STATS_INDEX, observed=True, dropna=False, sort=True).agg(
+            count=("p13a", "size"), p13a=("p13a", "sum"), p13b=("p13b", "sum"), p13c=("p13c", "sum"))
+    return stats.astype(np.int64)
+
+def _stats(df) -> pd.DataFrame:
+    """df if it is an accident_stats table already, its accident_stats otherwise"""
+    return df if not isinstance(df, dict) and df.index.names == STATS_INDEX else accident_stats(df)
+
 # Ukol 2: následky nehod v jednotlivých regionech
+@_profiled
 def plot_conseq(df: pd.DataFrame, fig_location: str = None,
                 show_figure: bool = False):
+    """df is the DataFrame of get_dataframe, a cube of DataDownloader.get_cube or their accident_stats"""
     sns.set()
     sns.color_palette('tab10')
 
@@ -90,28 +112,22 @@ def plot_conseq(df: pd.DataFrame, fig_location: str = None,
     fig.set_size_inches(w=8.2, h=20)
     fig.set_tight_layout({"h_pad":1})
 
-    dfByRegion = df.groupby(['region'])
+    #total accidents, deaths, heavy and light injuries by region
+    byRegion = _stats(df).groupby(level="region", observed=True).sum()
+    totalAccidents, deaths, heavyInjuries, lightInjuries = (byRegion[name] for name in ("count", "p13a", "p13b", "p13c"))
 
-    #total accidents
-    totalAccidents = dfByRegion['p1'].agg('count')
     #order regions by total accidents
     regions = list(totalAccidents.sort_values(ascending=False).keys())
     
     sns.barplot(ax=axes[3], x=totalAccidents.index, y=totalAccidents.values, order=regions)
     axes[3].set_title("Total Accidents")
 
-    #deaths
-    deaths = dfByRegion['p13a'].agg('sum')
     sns.barplot(ax=axes[0], x=deaths.index, y=deaths.values, order=regions)
     axes[0].set_title("Deaths by Region")
 
-    #heavy injuries
-    heavyInjuries = dfByRegion['p13b'].agg('sum')
     sns.barplot(ax=axes[1], x=heavyInjuries.index, y=heavyInjuries.values, order=regions)
     axes[1].set_title("Heavy Injuries by Region")
 
-    #light injuries
-    lightInjuries = dfByRegion['p13c'].agg('sum')
     sns.barplot(ax=axes[2], x=lightInjuries.index, y=lightInjuries.values, order=regions)
     axes[2].set_title("Light Injuries")
 
@@ -121,12 +137,14 @@ def plot_conseq(df: pd.DataFrame, fig_location: str = None,
     if show_figure:
         plt.show()
 
-    return
+    return fig
 
 
 # Ukol3: příčina nehody a škoda
+@_profiled
 def plot_damage(df: pd.DataFrame, fig_location: str = None,
                 show_figure: bool = False):
+    """df is the DataFrame of get_dataframe, a cube of DataDownloader.get_cube or their accident_stats"""
     sns.set()
     chosenRegions = ['PHA', 'HKK', 'JHM', 'PLK']
     colRenameDict = {
@@ -134,11 +152,14 @@ def plot_damage(df: pd.DataFrame, fig_location: str = None,
         "p12":"Príčina Nehody",
     }
 
-    #get binned damage
-    dmg = (tmp:=df[["region","p53", "p12"]])[tmp.region.isin(chosenRegions)]
+    #accident counts of the chosen regions, the causes and damages outside of the bins are left out like by pd.cut
+    dmg = _stats(df)["count"].reset_index()
+    dmg = dmg[dmg["region"].isin(chosenRegions) & dmg["p12"].notna() & dmg["p53"].notna()]
+    #a row of plots for the chosen regions only, not for every level of a categorical region
+    dmg["region"] = dmg["region"].astype(str)
 
     dmg.rename(columns=colRenameDict, inplace=True)
-    grid = sns.catplot(data=dmg, kind='count', x='p53', hue=colRenameDict['p12'], row=colRenameDict['region'], legend_out=True)
+    grid = sns.catplot(data=dmg, kind='bar', x='p53', y='count', hue=colRenameDict['p12'], row=colRenameDict['region'], legend_out=True, errorbar=None)
     grid.set(yscale="log", ylabel="Počet Nehod")
 
     if fig_location:
@@ -147,11 +168,66 @@ def plot_damage(df: pd.DataFrame, fig_location: str = None,
     if show_figure:
         plt.show()
 
-    return
+    return grid.figure
+
+def _month_ends(months: np.ndarray) -> pd.DatetimeIndex:
+    """The month end dates resample('M') labels the months with, months counted from 1970-01"""
+    return pd.DatetimeIndex(((months + 1).astype("datetime64[M]").astype("datetime64[D]") - 1).astype("datetime64[s]"))
+
+def monthly_surface(df, counts: pd.DataFrame = None) -> pd.DataFrame:
+    """Accident counts per region and month with a column per road surface (p16)
+
+    df is the DataFrame of get_dataframe or a cube of DataDownloader.get_cube. The rows are
+    counted in one bincount over the integer codes of the region, the month and p16, rows
+    without a date, a region or p16 are left out. The result is indexed by (region, month end date) and only
+    holds the months with accidents. With counts (a previous result) the counts of df are
+    added to them, so new months are counted without counting the old rows again.
+    """
+    if isinstance(df, dict):
+        known = df["year"] >= 0
+        regionValues = np.char.decode(df["region"][known], "ascii")
+        months = (df["year"][known].astype(np.int64) - 1970) * 12 + df["month"][known] - 1
+        surfaceValues, weights = df["surface"][known], df["count"][known]
+    else:
+        #categorical columns are factorized by their codes
+        known = df["date"].notna().to_numpy()
+        regionValues = df["region"][known]
+        months = df["date"].to_numpy()[known].astype("datetime64[M]").astype(np.int64)
+        surfaceValues, weights = df["p16"][known], None
+
+    regionCodes, regions = pd.factorize(regionValues, sort=True)
+    surfaceCodes, surfaces = pd.factorize(surfaceValues, sort=True)
+    #rows without a region or p16 (code -1) are left out, like crosstab leaves them out
+    counted = (regionCodes >= 0) & (surfaceCodes >= 0)
+    if not counted.all():
+        regionCodes, surfaceCodes, months = regionCodes[counted], surfaceCodes[counted], months[counted]
+        weights = weights[counted] if weights is not None else None
+    firstMonth = months.min() if months.shape[0] else 0
+    monthCount = int(months.max() - firstMonth + 1) if months.shape[0] else 0
+    cells = (regionCodes * monthCount + (months - firstMonth)) * len(surfaces) + surfaceCodes
+    table = np.bincount(cells, weights=weights, minlength=len(regions) * monthCount * len(surfaces)).astype(np.int64)
+    table = table.reshape(len(regions) * monthCount, len(surfaces))
+
+    index = pd.MultiIndex.from_product([np.asarray(regions), _month_ends(np.arange(monthCount) + firstMonth)], names=["region", "date"])
+    result = pd.DataFrame(table, index=index, columns=pd.Index(np.asarray(surfaces).astype(np.int64), name="p16"))
+    result = result[table.any(axis=1)]
+
+    if counts is not None:
+        result = counts.add(result, fill_value=0).fillna(0).astype(np.int64).sort_index()
+        result.columns.name = "p16"
+    return result
+
+def _region_months(monthly: pd.DataFrame, region: str) -> pd.DataFrame:
+    """The monthly counts of the region, every month from its first to its last accident"""
+    tmp = monthly.xs(region, level="region")
+    months = pd.period_range(tmp.index.min(), tmp.index.max(), freq='M').to_timestamp(how='end').normalize()
+    return tmp.reindex(index=months, fill_value=0)
 
 # Ukol 4: povrch vozovky
+@_profiled
 def plot_surface(df: pd.DataFrame, fig_location: str = None,
                  show_figure: bool = False):
+    """df is the DataFrame of get_dataframe, a cube of DataDownloader.get_cube or their monthly_surface"""
     roadSurfaceDict = {
         0:"jiný stav povrchu vozovky v době nehody",
         1:"povrch suchý, neznečištěný",
@@ -165,16 +241,11 @@ def plot_surface(df: pd.DataFrame, fig_location: str = None,
         9:"náhlá změna stavu vozovky"
     }
     sns.set()
-    cross = pd.crosstab([df["region"],df["date"]],[df["p16"]])
-    # cross.rename(roadSurfaceDic)
-
     chosenRegions = ['PHA', 'HKK', 'JHM', 'PLK']
 
-    regDataset = []
-    for region in chosenRegions:
-        tmp = cross.xs(region, level=0).resample('M').sum()
-        # tmp.rename(roadSurfaceDict)
-        regDataset.append((region,tmp))
+    #the counts per region, month and surface are computed once for all regions
+    monthly = df if not isinstance(df, dict) and df.index.names == ["region", "date"] else monthly_surface(df)
+    regDataset = [(region, _region_months(monthly, region)) for region in chosenRegions]
 
     fig, axes = plt.subplots(4)
     fig.set_size_inches(w=8.2, h=20)
@@ -199,7 +270,7 @@ def plot_surface(df: pd.DataFrame, fig_location: str = None,
     if show_figure:
         plt.show()
 
-    return
+    return fig
 
 if __name__ == "__main__":
     pass
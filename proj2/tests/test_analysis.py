@@ -0,0 +1,63 @@
+"""analysis against the row level pandas paths it replaced
+
+Run with `python -m pytest tests` from proj2.
+"""
+import sys, os
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import analysis
+
+def _accidents(rows, seed=0) -> pd.DataFrame:
+    """Accidents like the pickle of get_dataframe, with missing regions and the -1 default of p16"""
+    rng = np.random.default_rng(seed)
+    region = rng.choice(np.array(["PHA", "JHM", "HKK", "PLK"], dtype=object), rows)
+    region[rng.random(rows) < 0.02] = None
+    p16 = rng.integers(0, 10, rows)
+    p16[rng.random(rows) < 0.05] = -1
+    dates = np.datetime64("2019-01-01") + rng.integers(0, 3*365, rows).astype("timedelta64[D]")
+    return pd.DataFrame({
+        "region":region,
+        "p2a":dates.astype(str),
+        "p12":rng.integers(100, 700, rows),
+        "p16":p16,
+        "p53":rng.integers(0, 3000, rows),
+    })
+
+def _crosstab_months(df, region) -> pd.DataFrame:
+    """The monthly counts of the region the way plot_surface counted them before monthly_surface"""
+    cross = pd.crosstab([df["region"], df["date"]], [df["p16"]])
+    return cross.xs(region, level=0).resample("ME").sum()
+
+def test_monthly_surface_matches_crosstab():
+    raw = _accidents(5000)
+    #one PHA accident without a p16, it must not be counted in another cell
+    raw.loc[0, ["region", "p16"]] = ["PHA", np.nan]
+    df = analysis.frame.apply_plan(raw)
+    assert df["p16"].isna().any() and df["region"].isna().any()
+
+    monthly = analysis.monthly_surface(df)
+    for region in ["PHA", "JHM", "HKK", "PLK"]:
+        expected = _crosstab_months(df, region)
+        result = analysis._region_months(monthly, region)
+        expected.columns = expected.columns.astype(np.int64)
+        pd.testing.assert_frame_equal(result[expected.columns], expected, check_names=False, check_freq=False, check_dtype=False, check_index_type=False)
+        assert (result.drop(columns=expected.columns) == 0).all().all()
+
+def test_monthly_surface_of_cube_matches_rows():
+    df = analysis.frame.apply_plan(_accidents(5000, seed=1))
+    cube = {
+        "region":df["region"].astype(object).fillna("").to_numpy().astype("S3"),
+        "year":df["date"].dt.year.to_numpy().astype(np.int16),
+        "month":df["date"].dt.month.to_numpy().astype(np.int8),
+        "surface":df["p16"].astype(float).fillna(-2).to_numpy().astype(np.int16),
+        "count":np.ones(len(df), dtype=np.int64),
+    }
+    rows = analysis.monthly_surface(df)
+    cubeRows = analysis.monthly_surface(cube)
+    #the cube keeps the rows without a region or p16 under "" and -2, the row path leaves them out
+    cubeRows = cubeRows.drop(index="", level="region", errors="ignore").drop(columns=[-2], errors="ignore")
+    cubeRows = cubeRows[cubeRows.any(axis=1)]
+    pd.testing.assert_frame_equal(rows, cubeRows[rows.columns], check_names=False, check_dtype=False)
@@ -7,62 +7,15 @@ import contextily as ctx
 import sklearn.cluster
 import numpy as np
 # muzeze pridat vlastni knihovny
+import os, sys
+
+#the dtypes of the accident columns (proj1/frame.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "proj1"))
+import frame
 
 def categorize(df: pd.DataFrame) -> pd.DataFrame:
-    """Categorizis certain collumns and adds a date column"""
-    #add date column
-    df['date'] = pd.to_datetime(df['p2a'])
-
-    ##Convert to categories##
-    #get columns to convert to categories
-    # We don't want to categorize:
-    #   p1(id), date and region
-    #   float data
-    #   p2a(date), p2b(time)
-    #   p13a(deaths), p13b(heavy injuries), p13c (light injuries)
-    #   p14(total material damage(in czk))
-    #   p34(nubmer of vehicles)
-    #   p47(vehicle make year)(maybe?)
-
-    # We also don't want to automaticaly categorize:
-    #   p12(accident cause) - we want to bin this by main causes
-    #   p53(vehicle damage (in hundreds of czk)) - bin
-
-    #get column names
-    convertColsNames = list(df.select_dtypes(exclude='float32').columns)
-    convertColsNames.remove('p1')
-    convertColsNames.remove('date')
-    convertColsNames.remove('region')
-    #convertColsNames.remove('p2a')
-    #convertColsNames.remove('p2b')
-    convertColsNames.remove('p12')
-    convertColsNames.remove('p13a')
-    convertColsNames.remove('p13b')
-    convertColsNames.remove('p13c')
-    convertColsNames.remove('p14')
-    #convertColsNames.remove('p34')
-    convertColsNames.remove('p53')
-
-    #Automatic categorization
-    df[convertColsNames] = df[convertColsNames].astype('category')
-
-    #Manual categorizations
-    # accidentCauseBins = pd.IntervalIndex.from_tuples((100,200), (201,300), (301,400), (401,500), (501,600), (601,700), closed='both')
-    accidentCauseBins = [100,200,300,400,500,600,700]
-    accidentCauseLabels = [
-        "nezaviněná řidičem",
-        "nepřiměřená rychlost jízdy",
-        "nesprávné předjíždění",
-        "nedání přednosti v jízdě",
-        "nesprávný způsob jízdy",
-        "technická závada vozidla"
-    ]
-    df["p12"] = pd.cut(df["p12"], bins=accidentCauseBins, labels=accidentCauseLabels, include_lowest=True, right=False, ordered=False)
-
-    vehicleDamageBins =  [0,50,200,500,1000,float("inf")]
-    df["p53"] = pd.cut(df["p53"], bins=vehicleDamageBins, include_lowest=True)
-
-    return df
+    """Categorizis certain collumns and adds a date column, see the PLAN of proj1/frame.py"""
+    return frame.apply_plan(df)
 
 def make_geo(df: pd.DataFrame) -> geopandas.GeoDataFrame:
     """ Konvertovani dataframe do geopandas.GeoDataFrame se spravnym kodovani"""
@@ -124,6 +77,8 @@ def plot_geo(gdf: geopandas.GeoDataFrame, fig_location: str = None,
     if show_figure:
         plt.show()
 
+    return fig
+
 
 def plot_cluster(gdf: geopandas.GeoDataFrame, fig_location: str = None,
                  show_figure: bool = False):
@@ -165,6 +120,8 @@ def plot_cluster(gdf: geopandas.GeoDataFrame, fig_location: str = None,
     if show_figure:
         plt.show()
 
+    return fig
+
 
 if __name__ == "__main__":
     # zde muzete delat libovolne modifikace